@@ -0,0 +1,47 @@
+import pygame
+from pathlib import PurePath
+from threading import Lock
+
+
+# every image is read from disk once per process and the same surface is
+# shared by all sprites and game sessions. Without a display (the server,
+# headless runs) the loaded surface is used as it is, once a display is set
+# up images are converted to its pixel format on first use
+IMAGES_DIR = 'images'
+PRELOAD = ("bonus.png", "Player_blue.png", "Player_red.png", "icon.png")
+
+
+class Assets():
+    loaded = {}
+    converted = {}
+    display = None
+    headless = False
+    lock = Lock()
+
+
+def set_headless(headless=True):
+    # keeps surfaces in their file format even if a display exists
+    Assets.headless = headless
+
+
+def load_image(name):
+    with Assets.lock:
+        if name not in Assets.loaded:
+            Assets.loaded[name] = pygame.image.load(
+                PurePath(IMAGES_DIR, name))
+
+        display = pygame.display.get_surface()
+        if Assets.headless or display is None:
+            return Assets.loaded[name]
+
+        if display is not Assets.display:
+            Assets.converted.clear()
+            Assets.display = display
+        if name not in Assets.converted:
+            Assets.converted[name] = Assets.loaded[name].convert_alpha()
+        return Assets.converted[name]
+
+
+def preload(names=PRELOAD):
+    for name in names:
+        load_image(name)
@@ -0,0 +1,179 @@
+import socket
+import signal
+import struct
+import asyncio
+from contextlib import suppress
+from functools import partial
+from .session import ServerSession, TICK_RATE, prepare_server
+from .lobby import Lobby, MIN_PLAYERS, FILL_TIMEOUT, stream_closed
+from .maze_pool import POOL_SIZE
+from .protocol import read_message, write_message, encode_setup, \
+                      decode_client, encode_server, SETUP_RESEND
+
+
+# seconds a session waits for a message from its clients before it is
+# closed, both for the setup answer and for their input
+SESSION_TIMEOUT = 30
+BACKLOG = 1024
+
+
+class AsyncServer:
+    # all sessions run on one event loop, a session reads the input of
+    # its clients whenever it arrives and sends snapshots on its own tick.
+    # Clients wait in the lobby until it puts them into a room
+    def __init__(self, host="localhost", port=8080, 
+                 timeout=SESSION_TIMEOUT, room_size=MIN_PLAYERS, 
+                 fill_timeout=FILL_TIMEOUT, pool_size=POOL_SIZE):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.lobby = Lobby(room_size, fill_timeout, stream_closed)
+        self.pool_size = pool_size
+        self.pool = None
+        self.sessions = set()
+        self.session_number = 0
+
+
+    async def serve(self, *settings):
+        self.settings = settings
+        self.pool = prepare_server(*settings[:5], self.pool_size)
+        server = await asyncio.start_server(self.handle_client, 
+                                            self.host, self.port,
+                                            backlog=BACKLOG)
+        stop = asyncio.Event()
+        with suppress(NotImplementedError):
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, 
+                                                          stop.set)
+        matcher = asyncio.create_task(self.match_clients())
+        async with server:
+            try:
+                await stop.wait()
+            finally:
+                server.close()
+                matcher.cancel()
+                await self.shutdown()
+                if self.pool:
+                    self.pool.close()
+
+
+    async def shutdown(self):
+        for (_, writer), _ in self.lobby.waiting:
+            writer.close()
+        self.lobby.waiting.clear()
+        for session in self.sessions:
+            session.cancel()
+        await asyncio.gather(*self.sessions, return_exceptions=True)
+
+
+    async def handle_client(self, reader, writer):
+        writer.get_extra_info("socket").setsockopt(socket.IPPROTO_TCP, 
+                                                   socket.TCP_NODELAY, 1)
+        address = writer.get_extra_info("peername")
+        print(f"Connected to: {address[0]}:{address[1]}")
+        self.lobby.join((reader, writer))
+        self.match()
+
+
+    async def match_clients(self):
+        # rooms that are full start at once from handle_client, this
+        # starts the ones whose fill timeout is over and drops closed
+        # clients
+        while True:
+            await asyncio.sleep(self.lobby.wait_time())
+            self.match()
+
+
+    def match(self):
+        for _, writer in self.lobby.evict():
+            writer.close()
+        for clients in self.lobby.rooms():
+            session = asyncio.create_task(self.run_session(clients))
+            self.sessions.add(session)
+            session.add_done_callback(self.sessions.discard)
+            self.session_number += 1
+            print(f'{self.session_number = }')
+
+
+    async def read_frames(self, clients):
+        # one message from every client, read at the same time so a slow
+        # client doesn't delay reading the other one
+        reads = [asyncio.ensure_future(read_message(reader)) 
+                 for reader, _ in clients]
+        try:
+            done, pending = await asyncio.wait(
+                reads, timeout=self.timeout, 
+                return_when=asyncio.FIRST_EXCEPTION)
+        finally:
+            for read in reads:
+                read.cancel()
+
+        errors = [read.exception() for read in done if read.exception()]
+        if errors:
+            raise errors[0]
+        if pending:
+            raise asyncio.TimeoutError()
+        return [read.result() for read in reads]
+
+
+    async def run_session(self, clients):
+        try:
+            await self.play(clients)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, 
+                ConnectionError, ValueError, struct.error):
+            pass
+        finally:
+            for _, writer in clients:
+                writer.close()
+
+
+    async def read_inputs(self, session, num, reader, last_input):
+        loop = asyncio.get_running_loop()
+        while session.running:
+            session.receive(num, decode_client(await read_message(reader)))
+            last_input[num] = loop.time()
+
+
+    async def play(self, clients):
+        loop = asyncio.get_running_loop()
+        # generating the maze is the only long step, it runs off the loop
+        session = await loop.run_in_executor(
+            None, partial(ServerSession, len(clients), *self.settings,
+                          pool=self.pool))
+
+        for _, writer in clients:
+            write_message(writer, encode_setup(session.settings))
+        for (_, writer), answer in zip(clients, 
+                                       await self.read_frames(clients)):
+            if answer == SETUP_RESEND:
+                write_message(writer, session.walls)
+
+        last_input = [loop.time() for _ in clients]
+        readers = [asyncio.create_task(self.read_inputs(session, num, 
+                                                        reader, last_input))
+                   for num, (reader, _) in enumerate(clients)]
+        try:
+            next_tick = loop.time()
+            while session.running:
+                for reader in readers:
+                    if reader.done():
+                        # raises the error the client was lost with
+                        reader.result()
+                        return
+                if loop.time() - min(last_input) > self.timeout:
+                    raise asyncio.TimeoutError()
+
+                session.tick()
+                for num, (_, writer) in enumerate(clients):
+                    write_message(writer, encode_server(session.snapshot(num)))
+                await asyncio.gather(*(writer.drain() 
+                                       for _, writer in clients))
+
+                # a session that fell behind goes on from now instead of
+                # sending the ticks it missed at once
+                now = loop.time()
+                next_tick = max(next_tick + 1 / TICK_RATE, now)
+                await asyncio.sleep(next_tick - now)
+        finally:
+            for reader in readers:
+                reader.cancel()
+            await asyncio.gather(*readers, return_exceptions=True)
@@ -0,0 +1,96 @@
+import os
+import random
+import zipfile
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+from .maze import Maze
+from .render import render_chunks
+from .maze_file import EXTENSION, header_bytes, pack_cells
+
+
+def item_seed(base_seed, index):
+    # the seed of every maze depends only on the base seed and its index,
+    # not on the number of workers or the order they finish in
+    return int(np.random.SeedSequence(base_seed, spawn_key=(index,))
+               .generate_state(1)[0])
+
+
+def generate_item(alg, width, height, base_seed, index, file_format,
+                  solution):
+    seed = item_seed(base_seed, index)
+    my_maze = Maze(alg, (width, height), seed=seed)
+
+    if file_format == "maze":
+        data = header_bytes(width, height, my_maze.algorithm_name, seed) + \
+            pack_cells(my_maze.maze[1::2], my_maze.maze[2::2]).tobytes()
+        extension = EXTENSION
+    else:
+        if solution:
+            my_maze.solve()
+        data = b"".join(render_chunks(my_maze.maze))
+        extension = ".txt"
+    return f"maze_{index:06d}_{seed}{extension}", data
+
+
+def generate_chunk(alg, width, height, base_seed, indices, file_format,
+                   solution, directory):
+    # workers write straight into a directory, for an archive the data
+    # goes back to the parent process which owns the archive
+    items = []
+    for index in indices:
+        name, data = generate_item(alg, width, height, base_seed, index,
+                                   file_format, solution)
+        if directory:
+            with open(os.path.join(directory, name), "wb") as file:
+                file.write(data)
+            items.append((name, len(data), None))
+        else:
+            items.append((name, len(data), data))
+    return items
+
+
+def start_batch_generator(alg, width, height, count, output, jobs,
+                          seed, file_format, solution):
+    jobs = jobs or os.cpu_count()
+    seed = random.randrange(2 ** 32) if seed is None else seed
+
+    if output.endswith(".zip"):
+        archive = zipfile.ZipFile(output, "w", zipfile.ZIP_DEFLATED)
+        directory = None
+    else:
+        os.makedirs(output, exist_ok=True)
+        archive = None
+        directory = output
+
+    # a few chunks per worker keep every core busy without paying
+    # inter-process overhead for every single maze
+    chunk_size = max(1, min(256, count // (jobs * 4)))
+    chunks = [range(start, min(start + chunk_size, count))
+              for start in range(0, count, chunk_size)]
+
+    start_time = perf_counter()
+    total_bytes = 0
+    try:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            futures = [executor.submit(generate_chunk, alg, width, height,
+                                       seed, chunk, file_format, solution,
+                                       directory)
+                       for chunk in chunks]
+            for future in futures:
+                for name, size, data in future.result():
+                    total_bytes += size
+                    if archive:
+                        archive.writestr(name, data)
+    finally:
+        if archive:
+            archive.close()
+    elapsed = perf_counter() - start_time
+
+    print(f"Generated {count} mazes {width}x{height} "
+          f"with {alg.__name__.removeprefix('alg_')} "
+          f"in {elapsed:.2f} sec on {jobs} workers")
+    print(f"Throughput: {count / elapsed:.1f} mazes/sec, "
+          f"{count * width * height / elapsed:.0f} cells/sec, "
+          f"{total_bytes / elapsed / 2 ** 20:.2f} MiB/sec")
+    print(f"Base seed: {seed}, output: {output}")
@@ -0,0 +1,208 @@
+import os
+import sys
+import json
+import random
+import platform
+import tempfile
+import tracemalloc
+import numpy as np
+import pygame
+from contextlib import redirect_stdout
+from functools import lru_cache
+from time import perf_counter
+from .maze import Maze, conv_ind
+from .solve import astar
+from .render import render_chunks
+from .generators import GENERATORS
+from .game import MazeWithGraphics, Simulation, Command, run_headless
+
+
+BENCH_SEED = 1
+
+
+class BenchCase:
+    def __init__(self, name, run, setup=lambda size: None, sizes=None,
+                 traced=True):
+        self.name = name
+        self.setup = setup
+        self.run = run
+        # fixed sizes replace the ones asked for on the command line
+        self.sizes = sizes
+        self.traced = traced
+
+
+@lru_cache(maxsize=1)
+def unsolved_maze(size, name="DFS"):
+    # astar doesn't change the grid, so every run can share one maze
+    return Maze(GENERATORS[name], (size, size), seed=BENCH_SEED)
+
+
+def solve_maze(my_maze):
+    return astar((1, 1), (conv_ind(my_maze.height) - 2,
+                          conv_ind(my_maze.width) - 2), my_maze.maze)
+
+
+def solved_maze(size):
+    my_maze = Maze(GENERATORS["DFS"], (size, size), seed=BENCH_SEED)
+    my_maze.solve()
+    return my_maze
+
+
+def saved_maze(save, path):
+    def setup(size):
+        save(Maze(GENERATORS["DFS"], (size, size), seed=BENCH_SEED), path)
+        return path
+    return setup
+
+
+def maze_with_graphics(size, draw=False):
+    pygame.init()
+    my_maze = MazeWithGraphics(GENERATORS["DFS"], (size, size),
+                               seed=BENCH_SEED)
+    if draw:
+        my_maze.set_elems_to_draw(True)
+    return my_maze
+
+
+def sprite_groups(my_maze):
+    my_maze.add_walls_to_group()
+    my_maze.add_solution_to_group()
+    my_maze.add_start_end_to_group()
+
+
+def headless_game(size):
+    my_maze = maze_with_graphics(size, draw=True)
+    return Simulation(my_maze, players_count=2, bonuses=True)
+
+
+def random_bots(world):
+    rng = random.Random(BENCH_SEED)
+    bot = lambda world, player: Command(*(rng.random() < 0.5
+                                          for _ in range(5)))
+    run_headless(world, [bot, bot], max_ticks=1000)
+
+
+def display(my_maze):
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        my_maze.display()
+
+
+def bench_cases(directory, solve_size=None):
+    cases = [BenchCase(f"generate:{name}",
+                       lambda size, alg=alg: Maze(alg, (size, size),
+                                                  seed=BENCH_SEED))
+             for name, alg in GENERATORS.items()]
+    cases += [
+        BenchCase("solve:astar", solve_maze, unsolved_maze),
+        BenchCase("save:txt",
+                  lambda args: args[0].save(args[1]),
+                  lambda size: (solved_maze(size),
+                                os.path.join(directory, "save.txt"))),
+        BenchCase("save:maze",
+                  lambda args: args[0].save_binary(args[1]),
+                  lambda size: (solved_maze(size),
+                                os.path.join(directory, "save.maze"))),
+        BenchCase("upload:txt",
+                  lambda path: Maze.upload(path, None),
+                  saved_maze(Maze.save,
+                             os.path.join(directory, "upload.txt"))),
+        BenchCase("upload:maze",
+                  lambda path: Maze.upload(path, None),
+                  saved_maze(Maze.save_binary,
+                             os.path.join(directory, "upload.maze"))),
+        BenchCase("render",
+                  lambda my_maze: b"".join(render_chunks(my_maze.maze)),
+                  solved_maze),
+        BenchCase("display", display, solved_maze),
+        BenchCase("set_elems_to_draw",
+                  lambda my_maze: my_maze.set_elems_to_draw(True),
+                  maze_with_graphics),
+        BenchCase("sprite_groups", sprite_groups,
+                  lambda size: maze_with_graphics(size, draw=True)),
+        BenchCase("simulate:1000_ticks", random_bots, headless_game),
+    ]
+    if solve_size:
+        # DFS is too slow to build at this side and tracing astar takes
+        # minutes there, Sidewinder builds in numpy and is still a long search
+        cases.append(BenchCase("solve:astar_large", solve_maze,
+                               lambda size: unsolved_maze(size, "Sidewinder"),
+                               sizes=[solve_size], traced=False))
+    return cases
+
+
+def measure(case, size, repeat):
+    times = []
+    for _ in range(repeat):
+        state = case.setup(size)
+        start = perf_counter()
+        case.run(size if state is None else state)
+        times.append(perf_counter() - start)
+
+    # a separate traced run, tracing slows the code down too much to time it
+    peak = None
+    if case.traced:
+        state = case.setup(size)
+        tracemalloc.start()
+        case.run(size if state is None else state)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {"seconds": min(times),
+            "mean_seconds": sum(times) / len(times),
+            "peak_bytes": peak}
+
+
+def compare(results, baseline, threshold, noise=1e-3):
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        before, after = baseline[key]["seconds"], result["seconds"]
+        ratio = after / before if before else float("inf")
+        flag = ratio > 1 + threshold and after - before > noise
+        if flag:
+            regressions.append(key)
+        print(f"{key:<28}{before:>12.4f}{after:>12.4f}{ratio:>8.2f}x"
+              f"{'  REGRESSION' if flag else ''}")
+    return regressions
+
+
+def start_benchmark(sizes, repeat, output, baseline, threshold, only,
+                    solve_size=None):
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for case in bench_cases(directory, solve_size):
+            if only and only not in case.name:
+                continue
+            for size in case.sizes or sizes:
+                key = f"{case.name}/{size}"
+                results[key] = measure(case, size, repeat)
+                peak = results[key]["peak_bytes"]
+                print(f"{key:<28}{results[key]['seconds']:>12.4f} sec"
+                      + (f"{peak / 2 ** 20:>10.2f} MiB" if peak is not None
+                         else ""))
+
+    report = {"meta": {"python": platform.python_version(),
+                       "numpy": np.__version__,
+                       "pygame": pygame.version.ver,
+                       "platform": platform.platform(),
+                       "sizes": sizes,
+                       "solve_size": solve_size,
+                       "repeat": repeat,
+                       "seed": BENCH_SEED},
+              "results": results}
+    with open(output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Results saved to {output}")
+
+    if baseline:
+        with open(baseline) as file:
+            baseline_results = json.load(file)["results"]
+        print(f"\n{'case':<28}{'baseline':>12}{'current':>12}{'ratio':>9}")
+        regressions = compare(results, baseline_results, threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) above "
+                  f"{threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print("No regressions")
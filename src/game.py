@@ -1,7 +1,10 @@
 import pygame
-from pathlib import PurePath
+import random
+import numpy as np
+from dataclasses import dataclass
 from time import time
 from .maze import Maze, Cell, conv_ind
+from .assets import load_image, preload
 
 
 class Globals():
@@ -11,36 +14,65 @@ class Globals():
     SURFACE_COLOR = (167, 255, 100) 
     PATH_COLOR    = (80,  200, 120) 
     CELL_SIZE = 20
-    END_GAME_TIME = [False, True]
-    COUNT_DESTROYED_WALLS = [0, 0]
-    DESTROYED_WALLS = []
+
+
+class GameState():
+    # what one game changes while it is played, every game has its own
+    def __init__(self, players_count=1):
+        self.end_game_time = [False] * players_count
+        self.count_destroyed_walls = [0] * players_count
+        self.destroyed_walls = []
 
 
 def size_convert(value):
     return conv_ind(value) * Globals.CELL_SIZE
 
 
+@dataclass
+class Command:
+    left:    bool = False
+    right:   bool = False
+    up:      bool = False
+    down:    bool = False
+    destroy: bool = False
+
+
+KEYS = {'left':    (pygame.K_LEFT,  pygame.K_a),
+        'right':   (pygame.K_RIGHT, pygame.K_d),
+        'up':      (pygame.K_UP,    pygame.K_w),
+        'down':    (pygame.K_DOWN,  pygame.K_s),
+        'destroy': (pygame.K_RSHIFT, pygame.K_LSHIFT)}
+
+
+def keyboard_command(num):
+    keystate = pygame.key.get_pressed()
+    return Command(*(keystate[keys[num]] for keys in KEYS.values()))
+
+
+def element_colors(sol):
+    return [Globals.SURFACE_COLOR, 
+            Globals.COLOR, 
+            Globals.PATH_COLOR if sol else Globals.SURFACE_COLOR, 
+            Globals.START_COLOR, 
+            Globals.END_COLOR]
+
+
 class MazeElementWithGraphics(Cell, pygame.sprite.Sprite):
+    # cells of one colour share a single never modified surface
+    images = {}
+
     def __init__(self, x, y, value, sol):
         Cell.__init__(self, x, y)
         pygame.sprite.Sprite.__init__(self)
         self.value = value
-        self.image = pygame.Surface([Globals.CELL_SIZE, 
-                                     Globals.CELL_SIZE])
-        
-        color = [Globals.SURFACE_COLOR, 
-                 Globals.COLOR, 
-                 Globals.PATH_COLOR if sol else Globals.SURFACE_COLOR, 
-                 Globals.START_COLOR, 
-                 Globals.END_COLOR]
-        
-        self.image.fill(color[value])
+        color = element_colors(sol)[value]
         
-        pygame.draw.rect(self.image, color[value], 
-                         pygame.Rect(x * Globals.CELL_SIZE, 
-                                     y * Globals.CELL_SIZE,
-                                     Globals.CELL_SIZE,
-                                     Globals.CELL_SIZE)) 
+        if color not in MazeElementWithGraphics.images:
+            image = pygame.Surface([Globals.CELL_SIZE, 
+                                    Globals.CELL_SIZE])
+            image.fill(color)
+            MazeElementWithGraphics.images[color] = image
+        self.image = MazeElementWithGraphics.images[color]
         
         self.rect = self.image.get_rect()
         self.rect.x = x * Globals.CELL_SIZE
@@ -51,35 +83,46 @@ class MazeBonuses(pygame.sprite.Sprite):
     def __init__(self, x, y, type):
         super().__init__()
         self.type = type
-        path_bonus = PurePath('images', 'bonus.png')
-        self.image = pygame.image.load(path_bonus)
+        self.image = load_image("bonus.png")
         self.rect = self.image.get_rect()
         self.rect.x = x * Globals.CELL_SIZE
         self.rect.y = y * Globals.CELL_SIZE
 
 
-    def update(self, player, maze):
+    def update(self, player, world):
         if self.rect.colliderect(player.rect) and self.type == "speed_up":
             player.speed *= 1.3
-            self.kill()
+            self.take(world)
         if self.rect.colliderect(player.rect) and self.type == "speed_down":
             player.speed *= 0.7
-            self.kill()
+            self.take(world)
         if self.rect.colliderect(player.rect) and self.type == "teleport":
-            x, y = maze.get_random_cell()
-            player.rect.x = x * Globals.CELL_SIZE
-            player.rect.y = y * Globals.CELL_SIZE
-            self.kill()
+            cell = world.maze.get_random_cell(world.rng)
+            if cell is not None:
+                player.rect.x = cell[0] * Globals.CELL_SIZE
+                player.rect.y = cell[1] * Globals.CELL_SIZE
+            self.take(world)
+
+
+    def take(self, world):
+        # the cell is free again for teleports
+        self.kill()
+        world.maze.release_cell(self.rect.x // Globals.CELL_SIZE,
+                                self.rect.y // Globals.CELL_SIZE)
 
 
 class MazeWithGraphics(Maze):
-    def __init__(self, algorithm, size, run_alg=True):
-        super().__init__(algorithm, size, run_alg)
+    def __init__(self, algorithm, size, run_alg=True, seed=None):
+        super().__init__(algorithm, size, run_alg, seed)
         self.elems_to_draw = None
+        self.show_path = False
+        self.static_layer = None
+        self.changed_rects = []
 
 
     def set_elems_to_draw(self, show_path):
         self.solve()
+        self.show_path = show_path
         self.elems_to_draw = [[MazeElementWithGraphics(i, j, 
                                                        self.maze[j][i], 
                                                        show_path)
@@ -95,8 +138,8 @@ class MazeWithGraphics(Maze):
 
     def add_start_end_to_group(self):
         start_end_cells = pygame.sprite.Group()
-        self.maze[1][1] = 3
-        self.maze[2 * self.height - 1][2 * self.width - 1] = 4
+        self.set_cells([1], [1], 3)
+        self.set_cells([2 * self.width - 1], [2 * self.height - 1], 4)
         self.elems_to_draw[1][1] = MazeElementWithGraphics(1, 1, 
                                                            self.maze[1][1],
                                                            None)
@@ -115,35 +158,64 @@ class MazeWithGraphics(Maze):
         return start_end_cells
     
 
-    def get_elem_position(self, type):
-        pos = []
-        [[pos.append((i, j))
-            for i in range(conv_ind(self.width)) if self.maze[j][i] == type]
-                for j in range(conv_ind(self.height))]
-        return pos
+    def get_walls_in(self, rect):
+        # wall sprites of the grid cells overlapped by rect
+        first_i = max(rect.left // Globals.CELL_SIZE, 0)
+        first_j = max(rect.top // Globals.CELL_SIZE, 0)
+        last_i = min((rect.right - 1) // Globals.CELL_SIZE,
+                     conv_ind(self.width) - 1)
+        last_j = min((rect.bottom - 1) // Globals.CELL_SIZE,
+                     conv_ind(self.height) - 1)
+        return [self.elems_to_draw[j][i]
+                for j in range(first_j, last_j + 1)
+                    for i in range(first_i, last_i + 1)
+                        if self.maze[j, i] == 1]
     
 
+    def destroy_wall(self, wall):
+        self.set_cells([wall.rect.x // Globals.CELL_SIZE],
+                       [wall.rect.y // Globals.CELL_SIZE], 0)
+        wall.kill()
+        if self.static_layer is not None:
+            self.static_layer.fill(Globals.SURFACE_COLOR, wall.rect)
+            self.changed_rects.append(wall.rect.copy())
+
+
+    def get_static_layer(self):
+        # walls, solution and start/end cells drawn once into one surface,
+        # one pixel per grid position scaled up to the cell size
+        if self.static_layer is None:
+            palette = np.empty((256, 3), dtype=np.uint8)
+            palette[:] = Globals.SURFACE_COLOR
+            palette[:5] = element_colors(self.show_path)
+            cells = pygame.surfarray.make_surface(palette[self.maze.T])
+            self.static_layer = pygame.transform.scale(
+                cells, (size_convert(self.width), size_convert(self.height)))
+            if pygame.display.get_surface():
+                self.static_layer = self.static_layer.convert()
+        return self.static_layer
+
+
+    def draw_changes(self, screen):
+        # copies the parts of the static layer changed since the last frame
+        rects, self.changed_rects = self.changed_rects, []
+        for rect in rects:
+            screen.blit(self.static_layer, rect, rect)
+        return rects
+
+
     def add_walls_to_group(self):
         walls_sprites_list = pygame.sprite.Group() 
         
-        [[walls_sprites_list.add(self.elems_to_draw[j][i]) 
-            for i in range(conv_ind(self.width)) if self.maze[j][i] == 1]
-                for j in range(conv_ind(self.height))]
+        walls_sprites_list.add(self.elems_to_draw[j][i] 
+                               for i, j in self.get_positions(1))
         
         return walls_sprites_list
     
-    def get_sol_position(self):
-        sol_list = []
-        [[sol_list.append((self.elems_to_draw[j][i].rect.x, self.elems_to_draw[j][i].rect.y))
-            for i in range(conv_ind(self.width)) if self.maze[j][i] == 2]
-                for j in range(conv_ind(self.height))]
-        return sol_list
-
     def add_solution_to_group(self):
         solution_sprites_list = pygame.sprite.Group() 
-        [[solution_sprites_list.add(self.elems_to_draw[j][i]) 
-            for i in range(conv_ind(self.width)) if self.maze[j][i] == 2] 
-                for j in range(conv_ind(self.height))]
+        solution_sprites_list.add(self.elems_to_draw[j][i] 
+                                  for i, j in self.get_positions(2))
         return solution_sprites_list
 
 
@@ -152,66 +224,60 @@ class Player(pygame.sprite.Sprite):
         super().__init__() 
         self.num = num
         self.speed = speed
-        path_blue = PurePath('images', "Player_blue.png")
-        path_red = PurePath('images', "Player_red.png")
-        self.image = pygame.image.load(path_blue)
-        if self.num:
-            self.image = pygame.image.load(path_red)
+        self.image = load_image("Player_red.png" if self.num 
+                                else "Player_blue.png")
         self.rect = self.image.get_rect()
         self.rect.x = 1.25 * Globals.CELL_SIZE
         self.rect.y = 1.25 * Globals.CELL_SIZE
     
     
-    def update(self, walls_sprites_list, end_cell, 
-               width_limit, height_limit, bonuses):
-        global end_flag
+    def update(self, command, world):
+        maze = world.maze
+        state = world.state
         self.speedx = 0
         self.speedy = 0
         old_x, old_y = self.rect.topleft
-        
-        keystate = pygame.key.get_pressed()
-        keys = {'left':    (pygame.K_LEFT,  pygame.K_a),
-                'right':   (pygame.K_RIGHT, pygame.K_d),
-                'down':    (pygame.K_DOWN,  pygame.K_s),
-                'up':      (pygame.K_UP,    pygame.K_w),
-                'destroy': (pygame.K_RSHIFT, pygame.K_LSHIFT)}
-
-        if keystate[keys['left'][self.num]]:
+        old_rect = self.rect.copy()
+
+        if command.left:
             self.speedx = -self.speed
-        if keystate[keys['right'][self.num]]:
+        if command.right:
             self.speedx = self.speed
-        if keystate[keys['down'][self.num]]:
+        if command.down:
             self.speedy = self.speed
-        if keystate[keys['up'][self.num]]:
+        if command.up:
             self.speedy = -self.speed
 
         self.rect.x += self.speedx
         self.rect.y += self.speedy
 
-        if self.rect.left <= 0 or self.rect.right >= width_limit:
+        if self.rect.left <= 0 or self.rect.right >= world.width_limit:
             self.rect.x = old_x
         
-        if self.rect.top <= 0 or self.rect.bottom >= height_limit:
+        if self.rect.top <= 0 or self.rect.bottom >= world.height_limit:
             self.rect.y = old_y
 
         
-        for wall in walls_sprites_list:
+        # only walls under the old or the new position can collide, they
+        # are checked in the same row-major order the walls group has
+        for wall in maze.get_walls_in(self.rect.union(old_rect)):
             if self.rect.colliderect(wall.rect):
                 self.rect.x = old_x
                 self.rect.y = old_y
 
-                if (keystate[keys['destroy'][self.num]] and  
-                        Globals.COUNT_DESTROYED_WALLS[self.num] < 3 and
-                        bonuses):
+                if (command.destroy and  
+                        state.count_destroyed_walls[self.num] < 3 and
+                        world.bonuses):
                     
-                    Globals.COUNT_DESTROYED_WALLS[self.num] += 1 
-                    Globals.DESTROYED_WALLS = [wall.rect.x, wall.rect.y]
-                    wall.kill()
+                    state.count_destroyed_walls[self.num] += 1 
+                    state.destroyed_walls.append((wall.rect.x, 
+                                                  wall.rect.y))
+                    maze.destroy_wall(wall)
                 
-        if (self.rect.colliderect(end_cell.rect) and 
-                not Globals.END_GAME_TIME[self.num]):
+        if (self.rect.colliderect(world.end_cell.rect) and 
+                not state.end_game_time[self.num]):
             
-            Globals.END_GAME_TIME[self.num] = time()
+            state.end_game_time[self.num] = world.now()
 
         
             
@@ -220,27 +286,121 @@ class Player(pygame.sprite.Sprite):
         surface.blit(self.image, self.rect)
 
 
-def print_winner(start_time, players_count):
-    if Globals.END_GAME_TIME[0] and Globals.END_GAME_TIME[1]: 
+def player_name(num, players_count):
+    # the first player is blue and the others are red, numbered when
+    # there are more than two players
+    if num == 0:
+        return "BLUE"
+    return "RED" if players_count == 2 else f"RED {num}"
+
+
+def print_winner(state, start_time, players_count):
+    end_game_time = state.end_game_time
+    if all(end_game_time): 
         
-        print("BLUE TIME: ", end='')
-        print(f"{Globals.END_GAME_TIME[0] - start_time:.2f} sec")
-                
-        if players_count == 2:
-            print("RED TIME: ", end='')
-            print(f"{Globals.END_GAME_TIME[1] - start_time:.2f} sec")
+        for num in range(players_count):
+            print(f"{player_name(num, players_count)} TIME: ", end='')
+            print(f"{end_game_time[num] - start_time:.2f} sec")
                     
+        if players_count > 1:
             print("WINNER: ", end='')
-            if (Globals.END_GAME_TIME[1] < Globals.END_GAME_TIME[0]):
-                print('RED')
-            else:
-                print('BLUE')
+            winner = min(range(players_count), 
+                         key=lambda num: end_game_time[num])
+            print(player_name(winner, players_count))
                 
         pygame.quit()  
         quit()
     
 
 
+def make_bonuses(maze, rng=random):
+    # bonuses on random free cells, the first ones are teleports, then
+    # 4 speed ups and 4 speed downs, as many as there are free cells for
+    types = ["teleport"] * ((maze.width + maze.height) // 2) + \
+            ["speed_up"] * 4 + ["speed_down"] * 4
+    bonuses = []
+    for type in types:
+        cell = maze.get_random_cell(rng)
+        if cell is None:
+            break
+        bonuses.append(MazeBonuses(*cell, type))
+    return bonuses
+
+
+class Simulation:
+    # the game world without a window or keyboard, it advances one tick per
+    # step from the commands of the players. Finish times are seconds when
+    # realtime is set and tick numbers otherwise. The same maze and bonus
+    # seed always give the same bonuses, teleports draw from the same rng.
+    # Taken bonuses are logged by their index in bonus_list and destroyed
+    # walls in state.destroyed_walls, in the order it happened
+    def __init__(self, maze, players_count=1, speed=2, bonuses=False,
+                 bonus_seed=None, realtime=False):
+        self.maze = maze
+        self.realtime = realtime
+        self.tick = 0
+        self.width_limit = size_convert(maze.width)
+        self.height_limit = size_convert(maze.height)
+        self.start_end_cells = maze.add_start_end_to_group()
+        self.end_cell = self.start_end_cells.sprites()[1]
+
+        self.rng = random.Random(bonus_seed)
+        self.bonuses = bonuses
+        self.bonus_list = make_bonuses(maze, self.rng) if bonuses else []
+        self.bonuses_group = pygame.sprite.RenderUpdates(*self.bonus_list)
+        self.removed_bonuses = []
+
+        self.players = [Player(num, speed=speed)
+                        for num in range(players_count)]
+        self.players_group = pygame.sprite.RenderUpdates(*self.players)
+
+        self.state = GameState(players_count)
+        self.start_time = self.now()
+
+
+    def now(self):
+        return time() if self.realtime else self.tick
+
+
+    def move_players(self, commands):
+        # None leaves a player where it is, e.g. one moved by the network
+        for player, command in zip(self.players, commands):
+            if command is not None:
+                player.update(command, self)
+
+
+    def update_bonuses(self):
+        if self.bonuses:
+            count = len(self.bonuses_group)
+            for player in self.players:
+                self.bonuses_group.update(player, self)
+            if len(self.bonuses_group) != count:
+                removed = set(self.removed_bonuses)
+                self.removed_bonuses += [
+                    index for index, bonus in enumerate(self.bonus_list)
+                    if not bonus.alive() and index not in removed]
+
+
+    def step(self, commands):
+        self.tick += 1
+        self.move_players(commands)
+        self.update_bonuses()
+        return self.finished()
+
+
+    def finished(self):
+        return all(self.state.end_game_time)
+
+
+def run_headless(world, bots, max_ticks=10000):
+    # bots are functions world, player -> Command
+    while world.tick < max_ticks:
+        if world.step([bot(world, player)
+                       for bot, player in zip(bots, world.players)]):
+            break
+    return world.tick
+
+
 def start_game(alg, width, height, filename,
                solution, players_count, bonuses, speed):
     pygame.init()
@@ -256,39 +416,15 @@ def start_game(alg, width, height, filename,
                                       size_convert(my_maze.height)))
 
     pygame.display.set_caption("Try to solve!")
-    path_icon = PurePath('images', "icon.png")
-    pygame_icon = pygame.image.load(path_icon)
-    pygame.display.set_icon(pygame_icon)
+    pygame.display.set_icon(load_image("icon.png"))
+    preload()
     clock = pygame.time.Clock() 
     
-    walls_sprites_list = my_maze.add_walls_to_group()
-    solution_sprites_list = my_maze.add_solution_to_group()
-    start_end_cells = my_maze.add_start_end_to_group()
-
-    if bonuses:
-        bonuse_tp = [MazeBonuses(*my_maze.get_random_cell(), "teleport") 
-                         for _ in range((my_maze.width + my_maze.height)//2)]
-        
-        bonuse_speed_up = [MazeBonuses(*my_maze.get_random_cell(), "speed_up")
-                               for _ in range(4)]
-        
-        bonuse_speed_down = [MazeBonuses(*my_maze.get_random_cell(),
-                                         "speed_down") for _ in range(4)]
-        
-        bonuses_group = pygame.sprite.Group(*bonuse_tp, 
-                                            *bonuse_speed_up, 
-                                            *bonuse_speed_down)
-    
-    player_0 = Player(0, speed=speed)
-    group_players = pygame.sprite.Group()
-    group_players.add(player_0)
-
-    if players_count == 2:
-        player_1 = Player(1, speed=speed)
-        group_players.add(player_1)
-        Globals.END_GAME_TIME[1] = False
-
-    start_time = time()
+    world = Simulation(my_maze, players_count, speed, bonuses, 
+                       realtime=True)
+    static_layer = my_maze.get_static_layer()
+    screen.blit(static_layer, (0, 0))
+    pygame.display.flip()
 
     while True:
         for event in pygame.event.get():
@@ -296,27 +432,18 @@ def start_game(alg, width, height, filename,
                 print("You couldn't solve it!")
                 pygame.quit()  
                 quit()
-            print_winner(start_time, players_count)
-
-        walls_sprites_list.update() 
-        solution_sprites_list.update()
-        group_players.update(walls_sprites_list, start_end_cells.sprites()[1],
-                            size_convert(width), size_convert(height),
-                            bonuses)
-        start_end_cells.update()
-        if bonuses:
-            bonuses_group.update(player_0, my_maze)
-        if players_count == 2 and bonuses:
-            bonuses_group.update(player_1, my_maze)
+            print_winner(world.state, world.start_time, players_count)
+
+        world.step([keyboard_command(player.num) 
+                    for player in world.players])
         
-        screen.fill(Globals.SURFACE_COLOR)
-        walls_sprites_list.draw(screen)
-        solution_sprites_list.draw(screen)
-        start_end_cells.draw(screen)
-        group_players.draw(screen)
-        if bonuses:
-            bonuses_group.draw(screen)
+        # only the areas sprites left and destroyed walls are repainted
+        world.players_group.clear(screen, static_layer)
+        world.bonuses_group.clear(screen, static_layer)
+        dirty_rects = my_maze.draw_changes(screen)
+        dirty_rects += world.players_group.draw(screen)
+        dirty_rects += world.bonuses_group.draw(screen)
         
-        pygame.display.flip() 
+        pygame.display.update(dirty_rects) 
         clock.tick(60)
     
\ No newline at end of file
@@ -0,0 +1,136 @@
+import numpy as np
+from .maze import alg_DFS, alg_Prim, alg_Eller, conv_ind
+
+
+# every generator takes a Maze with all walls set, carves passages into
+# maze_cls.maze and marks the cells it has reached in maze_cls.visited
+GENERATORS = {"DFS": alg_DFS,
+              "Prim": alg_Prim,
+              "Eller": alg_Eller}
+
+
+def register_alg(name):
+    def decorator(func):
+        GENERATORS[name] = func
+        return func
+    return decorator
+
+
+def np_rng(maze_cls):
+    # vectorized generators draw from a NumPy generator seeded by the maze
+    return np.random.default_rng(maze_cls.rng.getrandbits(64))
+
+
+def carve(maze_cls, cells, next_cells):
+    # removes the walls between pairs of flat cell indices
+    width = maze_cls.width
+    cells = np.asarray(cells, dtype=np.intp)
+    next_cells = np.asarray(next_cells, dtype=np.intp)
+    rows = cells // width + next_cells // width + 1
+    cols = cells % width + next_cells % width + 1
+    maze_cls.maze[rows, cols] = 0
+    maze_cls.visited.fill(1)
+
+
+@register_alg("BinaryTree")
+def alg_BinaryTree(maze_cls):
+    # every cell carves north or east, the top row can only go east
+    # and the last column can only go north
+    rng = np_rng(maze_cls)
+    north = rng.random((maze_cls.height, maze_cls.width)) < 0.5
+    north[0, :] = False
+    north[:, -1] = True
+    maze_cls.maze[2:-1:2, 1::2][north[1:]] = 0
+    maze_cls.maze[1::2, 2:-1:2][~north[:, :-1]] = 0
+    maze_cls.visited.fill(1)
+
+
+@register_alg("Sidewinder")
+def alg_Sidewinder(maze_cls):
+    width, height = maze_cls.width, maze_cls.height
+    # the top row is one open corridor
+    maze_cls.maze[1, 2:-1:2] = 0
+
+    # below it every cell either extends the current run east or closes
+    # it, and a closed run carves north from one of its cells
+    rng = np_rng(maze_cls)
+    close = rng.random((height - 1, width)) < 0.5
+    close[:, -1] = True
+    maze_cls.maze[3::2, 2:-1:2][~close[:, :-1]] = 0
+
+    ends = np.flatnonzero(close)
+    starts = np.r_[0, ends[:-1] + 1]
+    picks = starts + (rng.random(len(ends)) *
+                      (ends - starts + 1)).astype(np.intp)
+    maze_cls.maze[2 * (picks // width + 1), conv_ind(picks % width)] = 0
+    maze_cls.visited.fill(1)
+
+
+def cell_edges(width, height):
+    # all pairs of flat indices of horizontally and vertically adjacent cells
+    cells = np.arange(width * height).reshape(height, width)
+    return np.concatenate([
+        np.stack([cells[:, :-1].ravel(), cells[:, 1:].ravel()], axis=1),
+        np.stack([cells[:-1, :].ravel(), cells[1:, :].ravel()], axis=1)])
+
+
+@register_alg("Kruskal")
+def alg_Kruskal(maze_cls):
+    width, height = maze_cls.width, maze_cls.height
+    edges = cell_edges(width, height)
+    edges = edges[np_rng(maze_cls).permutation(len(edges))].tolist()
+    parent = list(range(width * height))
+
+    def find(cell):
+        # path halving: every visited node is relinked to its grandparent
+        while parent[cell] != cell:
+            parent[cell] = parent[parent[cell]]
+            cell = parent[cell]
+        return cell
+
+    cells, next_cells = [], []
+    for cell, next_cell in edges:
+        root, next_root = find(cell), find(next_cell)
+        if root != next_root:
+            parent[next_root] = root
+            cells.append(cell)
+            next_cells.append(next_cell)
+            if len(cells) == width * height - 1:
+                break
+
+    carve(maze_cls, cells, next_cells)
+
+
+@register_alg("Wilson")
+def alg_Wilson(maze_cls):
+    width, height = maze_cls.width, maze_cls.height
+    in_tree = bytearray(width * height)
+    in_tree[maze_cls.rng.randrange(width * height)] = 1
+    # the last direction a random walk left each cell, following these
+    # pointers from the walk start gives the loop-erased path
+    next_step = [0] * (width * height)
+    cells, next_cells = [], []
+
+    for start in range(width * height):
+        cell = start
+        while not in_tree[cell]:
+            neighbors = []
+            if cell % width > 0:
+                neighbors.append(cell - 1)
+            if cell % width < width - 1:
+                neighbors.append(cell + 1)
+            if cell >= width:
+                neighbors.append(cell - width)
+            if cell < width * (height - 1):
+                neighbors.append(cell + width)
+            next_step[cell] = maze_cls.rng.choice(neighbors)
+            cell = next_step[cell]
+
+        cell = start
+        while not in_tree[cell]:
+            in_tree[cell] = 1
+            cells.append(cell)
+            next_cells.append(next_step[cell])
+            cell = next_step[cell]
+
+    carve(maze_cls, cells, next_cells)
@@ -0,0 +1,77 @@
+import socket
+from collections import deque
+from time import monotonic
+
+
+# a room starts as soon as room_size clients are waiting, or with the ones
+# that are there once the first of them has waited fill_timeout seconds.
+# Closed clients are looked for at least every EVICT_INTERVAL seconds
+MIN_PLAYERS = 2
+MAX_PLAYERS = 8
+FILL_TIMEOUT = 10
+EVICT_INTERVAL = 0.25
+
+
+def socket_closed(conn):
+    # waiting clients send nothing until their game is set up, so a
+    # readable socket has been closed or doesn't speak the protocol
+    try:
+        conn.setblocking(False)
+        conn.recv(1, socket.MSG_PEEK)
+        return True
+    except BlockingIOError:
+        return False
+    except OSError:
+        return True
+    finally:
+        conn.setblocking(True)
+
+
+def stream_closed(client):
+    reader, writer = client
+    return reader.at_eof() or writer.is_closing()
+
+
+class Lobby:
+    # clients wait in the order they came, a room takes the ones that
+    # have waited the longest
+    def __init__(self, room_size=MIN_PLAYERS, fill_timeout=FILL_TIMEOUT,
+                 closed=socket_closed):
+        self.room_size = room_size
+        self.fill_timeout = fill_timeout
+        self.closed = closed
+        self.waiting = deque()
+
+
+    def join(self, client):
+        self.waiting.append((client, monotonic()))
+
+
+    def evict(self):
+        # removes the closed clients and returns them
+        evicted = [client for client, _ in self.waiting
+                   if self.closed(client)]
+        if evicted:
+            self.waiting = deque(item for item in self.waiting
+                                 if item[0] not in evicted)
+        return evicted
+
+
+    def rooms(self):
+        rooms = []
+        while len(self.waiting) >= self.room_size:
+            rooms.append([self.waiting.popleft()[0]
+                          for _ in range(self.room_size)])
+        if (len(self.waiting) >= MIN_PLAYERS and
+                monotonic() - self.waiting[0][1] >= self.fill_timeout):
+            rooms.append([client for client, _ in self.waiting])
+            self.waiting.clear()
+        return rooms
+
+
+    def wait_time(self):
+        # seconds until the lobby has to be checked again
+        if not self.waiting:
+            return EVICT_INTERVAL
+        return min(EVICT_INTERVAL, max(0, self.fill_timeout -
+                                       (monotonic() - self.waiting[0][1])))
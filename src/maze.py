@@ -1,6 +1,17 @@
+import os
+import zlib
 import random
+import numpy as np
+from contextlib import nullcontext
 from time import strftime
 from .solve import astar
+from .render import RENDER_CHUNK_ROWS, render_rows, render_chunks, \
+                    write_chunks
+from .maze_file import MazeFile, EXTENSION, is_maze_file, \
+                       pack_cells, write_maze_file
+
+
+OCCUPIED = 255
 
 
 def conv_ind(value):
@@ -8,47 +19,187 @@ def conv_ind(value):
 
 
 def alg_Prim(maze_cls):
-    walls = []
-    cell = random.choice(random.choice(maze_cls.cells))
-    cell.visited = True
-    walls.extend(maze_cls.get_walls(cell))
-    while walls:
-        wall = random.choice(walls)
-        match wall[2]:
-            case "h":
-                cell_1 = maze_cls.cells[wall[0] // 2][(wall[1] - 2) // 2]
-                cell_2 = maze_cls.cells[wall[0] // 2][wall[1] // 2]
-            case "v":
-                cell_1 = maze_cls.cells[(wall[0] - 2) // 2][wall[1] // 2]
-                cell_2 = maze_cls.cells[wall[0] // 2][wall[1] // 2]
-        if cell_1.visited + cell_2.visited == 1:
-            maze_cls.maze[wall[0]][wall[1]] = 0
-            if not cell_1.visited:
-                walls.extend(maze_cls.get_walls(cell_1))
-                cell_1.visited = True
-            else:
-                walls.extend(maze_cls.get_walls(cell_2))
-                cell_2.visited = True
-        walls.remove(wall)
+    width, height = maze_cls.width, maze_cls.height
+    visited = bytearray(width * height)
+    # frontier holds (visited cell, neighbour) pairs; each pair is pushed
+    # at most once, because it is only pushed while the neighbour is
+    # unvisited and the other side is visited right before
+    frontier = []
+    carved = []
+
+    def visit(cell):
+        visited[cell] = 1
+        x, y = cell % width, cell // width
+        if x > 0 and not visited[cell - 1]:
+            frontier.append((cell, cell - 1))
+        if x < width - 1 and not visited[cell + 1]:
+            frontier.append((cell, cell + 1))
+        if y > 0 and not visited[cell - width]:
+            frontier.append((cell, cell - width))
+        if y < height - 1 and not visited[cell + width]:
+            frontier.append((cell, cell + width))
+
+    visit(maze_cls.rng.randrange(width * height))
+    while frontier:
+        # O(1) random pick-and-remove: swap with the last element and pop
+        i = maze_cls.rng.randrange(len(frontier))
+        frontier[i], frontier[-1] = frontier[-1], frontier[i]
+        cell, next_cell = frontier.pop()
+        if not visited[next_cell]:
+            row = cell // width + next_cell // width + 1
+            col = cell % width + next_cell % width + 1
+            carved.append(row * conv_ind(width) + col)
+            visit(next_cell)
+
+    maze_cls.maze.flat[carved] = 0
+    maze_cls.visited[:] = np.frombuffer(visited, dtype=np.uint8)\
+        .reshape(height, width)
 
 
 def alg_DFS(maze_cls):
     stack = []
-    cell = maze_cls.cells[0][0]
-    cell.visited = True
-    stack.append(cell)
+    x, y = 0, 0
+    maze_cls.visited[y, x] = 1
+    stack.append((x, y))
     while stack:
-        next_cell = maze_cls.get_neighbor(cell.x, cell.y)
+        next_cell = maze_cls.get_neighbor(x, y)
         if next_cell:
-            next_cell.visited = True
+            next_x, next_y = next_cell
+            maze_cls.visited[next_y, next_x] = 1
             
-            maze_cls.maze[next_cell.y + cell.y + 1]\
-                [next_cell.x + cell.x + 1] = 0
+            maze_cls.maze[next_y + y + 1, next_x + x + 1] = 0
             
-            cell = next_cell
-            stack.append(cell)
+            x, y = next_cell
+            stack.append(next_cell)
         elif stack:
-            cell = stack.pop()
+            x, y = stack.pop()
+
+
+def eller_rows(width, height, rng=random):
+    # yields the grid one row at a time, keeping only the set labels of
+    # the current row in memory
+    yield np.ones(conv_ind(width), dtype=np.uint8)
+    sets = list(range(width))
+    next_set = width
+    # union-find over the set labels of the current row
+    parent = {}
+
+    def find(label):
+        root = label
+        while root in parent:
+            root = parent[root]
+        while label != root:
+            parent[label], label = root, parent[label]
+        return root
+
+    for y in range(height):
+        last_row = y == height - 1
+        cells = np.ones(conv_ind(width), dtype=np.uint8)
+        cells[1::2] = 0
+
+        # join adjacent cells of different sets, the last row joins all
+        parent.clear()
+        for x in range(width - 1):
+            left, right = find(sets[x]), find(sets[x + 1])
+            if left != right and (last_row or rng.random() < 0.5):
+                cells[conv_ind(x) + 1] = 0
+                parent[right] = left
+        sets = [find(label) for label in sets]
+        yield cells
+
+        bottom = np.ones(conv_ind(width), dtype=np.uint8)
+        if last_row:
+            yield bottom
+            return
+
+        # every set goes down through at least one of its cells
+        groups = {}
+        for x, label in enumerate(sets):
+            groups.setdefault(label, []).append(x)
+        for members in groups.values():
+            forced = rng.choice(members)
+            for x in members:
+                if x == forced or rng.random() < 0.5:
+                    bottom[conv_ind(x)] = 0
+                else:
+                    sets[x] = next_set
+                    next_set += 1
+        yield bottom
+
+
+def alg_Eller(maze_cls):
+    rows = eller_rows(maze_cls.width, maze_cls.height, maze_cls.rng)
+    for i, row in enumerate(rows):
+        maze_cls.maze[i] = row
+    maze_cls.visited.fill(1)
+
+
+def text_lut(wall_chars, free_chars):
+    lut = np.full(256, TEXT_INVALID, dtype=np.uint8)
+    lut[list(wall_chars)] = 1
+    lut[list(free_chars)] = 0
+    return lut
+
+
+# glyphs on even and odd columns of the text format and their grid values
+TEXT_INVALID = 2
+TEXT_EVEN_LUT = text_lut(b"+|", b" @")
+TEXT_ODD_LUT = text_lut(b"-", b" @")
+TEXT_CHUNK_ROWS = 4096
+
+
+def read_text_grid(path):
+    # every line of the text format is 4 * width + 1 characters long, so
+    # the file is read in blocks of whole lines and every glyph is looked
+    # up by its first character
+    with open(path, "rb") as file:
+        first = file.readline()
+        if not first.rstrip(b"\r\n"):
+            raise ValueError(f"{path}: the first line of a maze is empty")
+        newline = first[len(first.rstrip(b"\r\n")):]
+        line_size = len(first)
+        text_size = line_size - len(newline)
+
+        size = os.fstat(file.fileno()).st_size
+        if newline and size % line_size:
+            size += len(newline)
+        rows, extra = divmod(size, line_size)
+        if not newline or extra or text_size % 4 != 1 or \
+                rows % 2 == 0 or rows < 3:
+            raise ValueError(f"{path}: lines of a maze must have the same "
+                             f"length 4 * width + 1 and their count must "
+                             f"be 2 * height + 1")
+
+        grid = np.empty((rows, text_size // 2 + 1), dtype=np.uint8)
+        file.seek(0)
+        for start in range(0, rows, TEXT_CHUNK_ROWS):
+            count = min(TEXT_CHUNK_ROWS, rows - start)
+            block = file.read(count * line_size)
+            block += newline * (len(block) < count * line_size)
+            lines = np.frombuffer(block, dtype=np.uint8)\
+                .reshape(count, line_size)
+            chars = lines[:, :text_size:2]
+            values = grid[start:start + count]
+            values[:, 0::2] = TEXT_EVEN_LUT[chars[:, 0::2]]
+            values[:, 1::2] = TEXT_ODD_LUT[chars[:, 1::2]]
+
+            bad_rows = np.flatnonzero(
+                (values == TEXT_INVALID).any(axis=1) |
+                (lines[:, text_size:] != np.frombuffer(newline, np.uint8))
+                .any(axis=1))
+            if len(bad_rows):
+                raise ValueError(f"{path}: unexpected character in line "
+                                 f"{start + bad_rows[0] + 1}")
+    return grid
+
+
+def write_text_grid(path, grid):
+    with open(path, "wb") as file:
+        file.writelines(render_chunks(grid))
+
+
+def save_name(extension=".txt"):
+    return "maze_" + strftime("%H_%M_%S-%d_%m_%Y") + extension
 
 
 class Cell:
@@ -57,173 +208,242 @@ class Cell:
         self.y = y
         self.visited = False
 
+
+class FreeCells:
+    # cells in a list to draw from and their places in it, a claimed cell
+    # is swapped with the last one and popped
+    def __init__(self, cells):
+        self.cells = cells
+        self.places = {cell: i for i, cell in enumerate(cells)}
+
+    def __len__(self):
+        return len(self.cells)
+
+    def claim(self, cell):
+        i = self.places.pop(cell, None)
+        if i is None:
+            return
+        last = self.cells.pop()
+        if i < len(self.cells):
+            self.cells[i] = last
+            self.places[last] = i
+
+    def release(self, cell):
+        if cell not in self.places:
+            self.places[cell] = len(self.cells)
+            self.cells.append(cell)
+
+    def choice(self, rng):
+        return self.cells[rng.randrange(len(self.cells))]
+
         
 class Maze:
-    def __init__(self, algorithm, size, run_alg=True):
+    def __init__(self, algorithm, size, run_alg=True, seed=None):
         self.width, self.height = size
-        self.maze = [[0 if i % 2 and j % 2 else 1 
-                        for i in range(conv_ind(self.width))] 
-                            for j in range(conv_ind(self.height))]
-        self.cells = [[Cell(i, j) 
-                         for i in range(self.width)] 
-                             for j in range(self.height)]
+        self.seed = random.randrange(2 ** 32) if seed is None else seed
+        self.rng = random.Random(self.seed)
+        self.algorithm_name = \
+            algorithm.__name__.removeprefix("alg_") if run_alg else ""
+        self.maze = np.ones((conv_ind(self.height), conv_ind(self.width)),
+                            dtype=np.uint8)
+        self.maze[1::2, 1::2] = 0
+        self.visited = np.zeros((self.height, self.width), dtype=np.uint8)
+        self.solved = False
+        self.positions = {}
+        self.free_cells = None
         if run_alg:
             algorithm(self)
 
     
-    def set_zeros(self):
-        for j in range(conv_ind(self.height)):
-            for i in range(conv_ind(self.width)):
-                self.maze[j][i] = 0
-
-    def get_random_cell(self):
-        while self.maze[y := conv_ind(random.randint(1, self.height - 1))]\
-            [x := conv_ind(random.randint(1, self.width - 1))] != 0:
-            pass
-
-        self.maze[y][x] = -1
+    def own_grid(self):
+        # a grid shared through the maze cache is read only, the maze
+        # gets its own copy before it first changes it
+        if not self.maze.flags.writeable:
+            self.maze = self.maze.copy()
+
+    def get_positions(self, type):
+        # flat grid indices of a value are found in the grid the first time
+        # they are asked for, generators have written to it before that.
+        # Later writes go through set_cells, which keeps them up to date
+        if type not in self.positions:
+            self.positions[type] = dict.fromkeys(
+                np.flatnonzero(self.maze == type).tolist())
+        cols = conv_ind(self.width)
+        return [(i % cols, i // cols) for i in self.positions[type]]
+
+    def set_cells(self, xs, ys, value):
+        self.own_grid()
+        old = self.maze[ys, xs].tolist()
+        self.maze[ys, xs] = value
+        if self.positions:
+            cols = conv_ind(self.width)
+            for x, y, before in zip(xs, ys, old):
+                if before in self.positions:
+                    self.positions[before].pop(y * cols + x, None)
+                if value in self.positions:
+                    self.positions[value][y * cols + x] = None
+        if self.free_cells is not None:
+            update = self.free_cells.claim if value else \
+                     self.free_cells.release
+            for x, y in zip(xs, ys):
+                if x > 1 and y > 1 and x % 2 and y % 2:
+                    update((x, y))
+
+    def get_free_cells(self):
+        # built from the grid when first needed, the first row and column
+        # of cells are never given out
+        if self.free_cells is None:
+            self.free_cells = FreeCells(
+                [(conv_ind(i + 1), conv_ind(j + 1)) for j, i in
+                 np.argwhere(self.maze[3::2, 3::2] == 0).tolist()])
+        return self.free_cells
+
+    def get_random_cell(self, rng=random):
+        # None once every cell is taken
+        free_cells = self.get_free_cells()
+        if not free_cells:
+            return None
+
+        x, y = free_cells.choice(rng)
+        self.set_cells([x], [y], OCCUPIED)
         return x, y
-    
-    def set_elems(self, elems, type):
-        for i, j in elems:
-            self.maze[j][i] = type
-
-
-
-    def get_elems(self, type):
-        res = []
-        for j in range(conv_ind(self.height)):
-            for i in range(conv_ind(self.width)):
-                if self.maze[j][i] == type:
-                    res.append((i, j))
-        return res
-
 
+    def release_cell(self, x, y):
+        self.get_free_cells()
+        self.set_cells([x], [y], 0)
     
-    def get_walls(self, cell):
-        walls = []
-        if cell.x > 0 and self.maze[conv_ind(cell.y)][conv_ind(cell.x) - 1]:
-            walls.append((conv_ind(cell.y), conv_ind(cell.x) - 1, "h"))
+    def checksum(self):
+        return zlib.crc32(self.maze.tobytes())
 
-        if cell.x < self.width - 1 and self.maze[conv_ind(cell.y)]\
-                                           [conv_ind(cell.x) + 1]:
-            walls.append((conv_ind(cell.y), conv_ind(cell.x) + 1, "h"))
 
-        if cell.y > 0 and self.maze[conv_ind(cell.y) - 1]\
-                              [conv_ind(cell.x)]:
-            walls.append((conv_ind(cell.y) - 1, conv_ind(cell.x), "v"))
-
-        if cell.y < self.height - 1 and self.maze[conv_ind(cell.y) + 1]\
-                                            [conv_ind(cell.x)]:
-            walls.append((conv_ind(cell.y) + 1, conv_ind(cell.x), "v"))
-
-        return walls
-        
-    
     def get_neighbor(self, x, y):
         neighbors = []
 
-        if x > 0 and not self.cells[y][x - 1].visited:
-            neighbors.append(self.cells[y][x - 1])
+        if x > 0 and not self.visited[y, x - 1]:
+            neighbors.append((x - 1, y))
 
-        if x < self.width - 1 and not self.cells[y][x + 1].visited:
-            neighbors.append(self.cells[y][x + 1])
+        if x < self.width - 1 and not self.visited[y, x + 1]:
+            neighbors.append((x + 1, y))
 
-        if y > 0 and not self.cells[y - 1][x].visited:
-            neighbors.append(self.cells[y - 1][x])
+        if y > 0 and not self.visited[y - 1, x]:
+            neighbors.append((x, y - 1))
 
-        if y < self.height - 1 and not self.cells[y + 1][x].visited:
-            neighbors.append(self.cells[y + 1][x])
+        if y < self.height - 1 and not self.visited[y + 1, x]:
+            neighbors.append((x, y + 1))
         
-        return random.choice(neighbors) if neighbors else False
+        return self.rng.choice(neighbors) if neighbors else False
 
 
-    def save(self):
-        timestr = strftime("%H_%M_%S-%d_%m_%Y")
-
-        with open("maze_"+timestr+".txt", "w") as file:
-            file.writelines(["".join(row) + '\n' for row in self.maze])
+    def save(self, path=None):
+        write_text_grid(path or save_name(), self.maze)
     
 
-    def pretty_maze(self):
-        for i in range(conv_ind(self.height)):
-            for j in range(conv_ind(self.width)):
-
-                if (i + j) % 2 == 0 and self.maze[i][j] == 1:
-                    self.maze[i][j] = '+'
-                elif j % 2 and self.maze[i][j] == 1:
-                    self.maze[i][j] = '---'
-                elif i % 2 and self.maze[i][j] == 1:
-                    self.maze[i][j] = '|'
-                elif j % 2 == 0 and self.maze[i][j] == 2:
-                    self.maze[i][j] = '@'
-                elif j % 2 != 0 and self.maze[i][j] == 2:
-                    self.maze[i][j] = '@@@'    
-                elif j % 2 == 0:
-                    self.maze[i][j] = ' '
-                else:
-                    self.maze[i][j] = '   '
-
+    def save_binary(self, path=None):
+        write_maze_file(path or save_name(EXTENSION),
+                        self.width, self.height,
+                        self.algorithm_name, self.seed,
+                        [pack_cells(self.maze[1::2], self.maze[2::2])])
+    
 
     @classmethod        
     def upload(cls, path, algorithm):
-        lines = []
-        
-        with open(path, "r", encoding="UTF-8") as file:
-            for line in file:
-                buf = []
-                for line in line.rstrip("\n"):
-                    buf.append(line)
-                lines.append(buf)
-        
-        width = (len(lines[0]) - 1) // 2 + 1
-        height = len(lines)
-
+        if is_maze_file(path):
+            maze_file = MazeFile(path)
+            new = cls(algorithm, (maze_file.width, maze_file.height),
+                      run_alg=False, seed=maze_file.seed)
+            new.algorithm_name = maze_file.algorithm
+            new.maze = maze_file.grid()
+            new.visited.fill(1)
+            return new
+
+        grid = read_text_grid(path)
         new = cls(algorithm, 
-                  ((width - 1) // 2, (height - 1) // 2),
+                  ((grid.shape[1] - 1) // 2, (grid.shape[0] - 1) // 2),
                   run_alg=False)
-        
-        for i in range(len(lines)):
-            for j in range((len(lines[i]) - 1) // 2 + 1):
-                if lines[i][2 * j] == "+" or lines[i][2 * j] == "|":
-                    new.maze[i][j] = 1
-                elif j % 2 and lines[i][2 * j] == "-":
-                    new.maze[i][j] = 1
-                else:
-                    new.maze[i][j] = 0
-
+        new.maze = grid
+        new.visited.fill(1)
         return new
         
                     
     def solve(self):
+        if self.solved:
+            return
 
         solution = astar((1, 1), 
                          (conv_ind(self.height) - 2, 
                           conv_ind(self.width) - 2), 
                          self.maze)
         
-        for coord in solution:
-            self.maze[coord[0]][coord[1]] = 2
+        rows, cols = zip(*solution)
+        self.set_cells(list(cols), list(rows), 2)
+        self.solved = True
             
 
-    def display(self):
-        for i in range(conv_ind(self.height)):
-            for j in range(conv_ind(self.width)):
-                print(self.maze[i][j], end='')
-            print()
+    def display(self, stream=None):
+        write_chunks(render_chunks(self.maze), stream)
+
+
+def grid_blocks(rows, block_rows=RENDER_CHUNK_ROWS):
+    # the north border alone, then blocks of whole cell rows, each cell row
+    # followed by the row under it
+    yield next(rows)[np.newaxis]
+    block = []
+    for row in rows:
+        block.append(row)
+        if len(block) == 2 * block_rows:
+            yield np.stack(block)
+            block = []
+    if block:
+        yield np.stack(block)
+
+
+def stream_maze(width, height, save_maze, save_binary, seed):
+    seed = random.randrange(2 ** 32) if seed is None else seed
+    rows = eller_rows(width, height, random.Random(seed))
+
+    with open(save_name(), "wb") if save_maze else nullcontext() as file:
+        def printed_blocks():
+            first_row = 0
+            for block in grid_blocks(rows):
+                text = render_rows(block, first_row)
+                write_chunks([text])
+                if file:
+                    file.write(text)
+                first_row += len(block)
+                yield block
+
+        blocks = printed_blocks()
+        if not save_binary:
+            for _ in blocks:
+                pass
+            return
+
+        # the north border is implied
+        next(blocks)
+        write_maze_file(save_name(EXTENSION), width, height, "Eller", seed,
+                        (pack_cells(block[0::2], block[1::2])
+                         for block in blocks))
 
 
 def start_generator(alg, width, height, 
-                    solution, filename, save_maze):
+                    solution, filename, save_maze,
+                    save_binary=False, seed=None):
+    # Eller's algorithm never needs the whole grid unless it is solved
+    if alg is alg_Eller and not filename and not solution:
+        stream_maze(width, height, save_maze, save_binary, seed)
+        return
+
     if filename:
         my_maze = Maze.upload(filename, alg)
     else:
-        my_maze = Maze(alg, (width, height))
+        my_maze = Maze(alg, (width, height), seed=seed)
     
+    if save_binary:
+        my_maze.save_binary()
+
     if solution:
         my_maze.solve()
 
-    my_maze.pretty_maze()
     my_maze.display()
 
     if save_maze:
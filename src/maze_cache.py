@@ -0,0 +1,101 @@
+import os
+from collections import OrderedDict
+from threading import Lock
+from .maze import Maze
+
+
+# solved mazes by file or by generator and seed, the least recently used
+# ones are dropped once their grids take more than max_bytes. Cached grids
+# are read only, a maze made from one shares it until its first write
+CACHE_BYTES = 64 * 2 ** 20
+
+
+def file_key(path):
+    # a changed file is a different maze
+    stat = os.stat(path)
+    return ("file", os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+
+
+def seed_key(algorithm, size, seed):
+    return ("seed", algorithm.__name__, *size, seed)
+
+
+class MazeCache:
+    def __init__(self, max_bytes=CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.mazes = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = Lock()
+
+
+    def maze(self, cls, key, make):
+        # make returns a solved Maze for a key that isn't cached, the
+        # result is a new cls maze sharing the cached grid
+        with self.lock:
+            cached = self.mazes.get(key)
+            if cached is not None:
+                self.mazes.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        if cached is None:
+            cached = make()
+            cached.maze.flags.writeable = False
+            cached.visited.flags.writeable = False
+            with self.lock:
+                if key not in self.mazes:
+                    self.mazes[key] = cached
+                    self.size += maze_bytes(cached)
+                    self.shrink()
+
+        my_maze = cls(None, (cached.width, cached.height), run_alg=False,
+                      seed=cached.seed)
+        my_maze.algorithm_name = cached.algorithm_name
+        my_maze.maze = cached.maze
+        my_maze.visited = cached.visited
+        my_maze.solved = cached.solved
+        return my_maze
+
+
+    def generate(self, cls, algorithm, size, seed):
+        return self.maze(cls, seed_key(algorithm, size, seed),
+                         lambda: solved(Maze(algorithm, size, seed=seed)))
+
+
+    def resize(self, max_bytes):
+        with self.lock:
+            self.max_bytes = max_bytes
+            self.shrink()
+
+
+    def shrink(self):
+        # called with the lock held
+        while self.size > self.max_bytes:
+            _, cached = self.mazes.popitem(last=False)
+            self.size -= maze_bytes(cached)
+            self.evictions += 1
+
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "evictions": self.evictions,
+                    "mazes": len(self.mazes),
+                    "bytes": self.size}
+
+
+def solved(my_maze):
+    my_maze.solve()
+    return my_maze
+
+
+def maze_bytes(my_maze):
+    return my_maze.maze.nbytes + my_maze.visited.nbytes
+
+
+MAZE_CACHE = MazeCache()
@@ -0,0 +1,92 @@
+import struct
+import numpy as np
+
+
+# binary maze format: a fixed header followed by 2 bits per cell, bit 0 is
+# the east wall and bit 1 is the south wall of the cell. The north and west
+# borders and the wall posts are implied. Every row of cells starts on a
+# byte boundary so any band of rows can be read without the rest of the file
+MAGIC = b"MAZE"
+VERSION = 1
+HEADER = struct.Struct("<4sBIIQ16s")
+EXTENSION = ".maze"
+
+
+def row_bytes(width):
+    return (width + 3) // 4
+
+
+def is_maze_file(path):
+    with open(path, "rb") as file:
+        return file.read(len(MAGIC)) == MAGIC
+
+
+def pack_cells(cell_rows, south_rows):
+    # odd rows of the maze grid and the rows under them -> packed cell rows
+    east = cell_rows[:, 2::2] == 1
+    south = south_rows[:, 1::2] == 1
+    height, width = east.shape
+    codes = np.zeros((height, 4 * row_bytes(width)), dtype=np.uint8)
+    codes[:, :width] = east
+    codes[:, :width] |= south.astype(np.uint8) << 1
+    codes = codes.reshape(height, -1, 4)
+    return (codes[..., 0] | codes[..., 1] << 2 |
+            codes[..., 2] << 4 | codes[..., 3] << 6)
+
+
+def unpack_cells(packed, width, top=None):
+    # packed cell rows -> maze grid rows, top is the packed row above them
+    # or None for the north border
+    height = len(packed)
+    codes = (packed[..., np.newaxis] >> np.array([0, 2, 4, 6],
+                                                  dtype=np.uint8)) & 3
+    codes = codes.reshape(height, -1)[:, :width]
+
+    grid = np.ones((2 * height + 1, 2 * width + 1), dtype=np.uint8)
+    grid[1::2, 1::2] = 0
+    grid[1::2, 2::2] = codes & 1
+    grid[2::2, 1::2] = codes >> 1
+    if top is not None:
+        grid[0, 1::2] = unpack_cells(top[np.newaxis], width)[2, 1::2]
+    return grid
+
+
+def header_bytes(width, height, algorithm, seed):
+    return HEADER.pack(MAGIC, VERSION, width, height, seed,
+                       algorithm.encode("ascii"))
+
+
+def write_maze_file(path, width, height, algorithm, seed, packed_rows):
+    # packed_rows yields the packed cell rows in order, in chunks of any size
+    with open(path, "wb") as file:
+        file.write(header_bytes(width, height, algorithm, seed))
+        for packed in packed_rows:
+            file.write(packed.tobytes())
+
+
+class MazeFile:
+    def __init__(self, path):
+        self.data = np.memmap(path, dtype=np.uint8, mode="r")
+        if len(self.data) < HEADER.size:
+            raise ValueError(f"{path} is not a maze file")
+        magic, version, self.width, self.height, self.seed, algorithm = \
+            HEADER.unpack_from(self.data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a maze file")
+        self.algorithm = algorithm.rstrip(b"\0").decode("ascii")
+        size = HEADER.size + self.height * row_bytes(self.width)
+        if len(self.data) != size:
+            raise ValueError(f"{path} has {len(self.data)} bytes, its "
+                             f"header describes {size}")
+        self.cells = self.data[HEADER.size:].reshape(
+            self.height, row_bytes(self.width))
+
+    def region(self, first_row, last_row):
+        # maze grid rows covering cell rows first_row..last_row - 1,
+        # only those rows of the file are read
+        top = self.cells[first_row - 1] if first_row > 0 else None
+        return unpack_cells(np.asarray(self.cells[first_row:last_row]),
+                            self.width, top)
+
+    def grid(self):
+        return self.region(0, self.height)
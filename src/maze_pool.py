@@ -0,0 +1,109 @@
+import os
+import random
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from threading import RLock, Thread
+from time import sleep
+from .maze import Maze
+from .game import MazeWithGraphics
+from .generators import GENERATORS
+
+
+# mazes kept ready for every configuration sessions have asked for, a
+# configuration starts with one in reserve and every session that finds
+# none ready doubles that up to POOL_SIZE. Worker processes generate and
+# solve the mazes, their sprites are made when a worker is done since
+# pygame objects can't be sent between processes
+POOL_SIZE = 16
+POOL_JOBS = 2
+
+
+def watch_parent(parent):
+    # workers wait for jobs forever, so they leave by themselves when the
+    # server is gone even if it was killed
+    while os.getppid() == parent:
+        sleep(1)
+    os._exit(0)
+
+
+def start_worker(parent):
+    Thread(target=watch_parent, args=(parent,), daemon=True).start()
+
+
+def prepare_maze(algorithm, width, height, seed):
+    my_maze = Maze(GENERATORS[algorithm], (width, height), seed=seed)
+    my_maze.solve()
+    return my_maze.maze
+
+
+class MazePool:
+    def __init__(self, size=POOL_SIZE, jobs=POOL_JOBS):
+        self.size = size
+        self.executor = ProcessPoolExecutor(
+            max_workers=min(jobs, os.cpu_count()),
+            initializer=start_worker, initargs=(os.getpid(),))
+        # a worker may finish before its callback is added, which then
+        # runs at once in the thread that holds the lock
+        self.lock = RLock()
+        self.ready = {}
+        self.pending = {}
+        self.targets = {}
+
+
+    def reserve(self, alg, width, height, solution):
+        # starts making mazes of a configuration before anyone asks
+        key = (alg.__name__.removeprefix("alg_"), width, height, solution)
+        with self.lock:
+            self.ready.setdefault(key, deque())
+            self.targets[key] = max(self.targets.get(key, 0), 1)
+            self.refill(key)
+        return key
+
+
+    def take(self, alg, width, height, solution):
+        # a maze with its sprites, or None if none is ready yet
+        key = self.reserve(alg, width, height, solution)
+        with self.lock:
+            if self.ready[key]:
+                my_maze = self.ready[key].popleft()
+            else:
+                my_maze = None
+                self.targets[key] = min(self.size, 2 * self.targets[key])
+            self.refill(key)
+        return my_maze
+
+
+    def refill(self, key):
+        # called with the lock held, the seeds are drawn here since forked
+        # workers would all start from the same random state
+        while (len(self.ready[key]) + self.pending.get(key, 0) <
+                self.targets[key]):
+            seed = random.randrange(2 ** 32)
+            future = self.executor.submit(prepare_maze, *key[:3], seed)
+            self.pending[key] = self.pending.get(key, 0) + 1
+            future.add_done_callback(
+                lambda future, key=key, seed=seed:
+                    self.prepared(key, seed, future))
+
+
+    def prepared(self, key, seed, future):
+        my_maze = None
+        if not future.cancelled() and future.exception() is None:
+            algorithm, width, height, solution = key
+            my_maze = MazeWithGraphics(GENERATORS[algorithm],
+                                       (width, height), run_alg=False,
+                                       seed=seed)
+            my_maze.algorithm_name = algorithm
+            my_maze.maze = future.result()
+            my_maze.visited.fill(1)
+            my_maze.solved = True
+            my_maze.set_elems_to_draw(solution)
+
+        with self.lock:
+            self.pending[key] -= 1
+            if my_maze is not None:
+                self.ready[key].append(my_maze)
+
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
@@ -1,57 +1,178 @@
 import socket
-import json
+import struct
+import asyncio
 import pygame
-from pathlib import PurePath
-from dataclasses import dataclass, asdict
-from time import time
-from .game import MazeWithGraphics, size_convert, \
-                     MazeBonuses, Player, Globals, print_winner
-from threading import Thread
-
-
-@dataclass
-class SetUpGame:
-    width:    int 
-    height:   int
-    speed:    int
-    solution: bool
-    walls:    list
-    bonuses:  list
+import numpy as np
+from collections import deque
+from queue import Queue, Empty
+from .game import MazeWithGraphics, size_convert, Simulation, \
+                     print_winner, keyboard_command, Globals
+from .generators import GENERATORS
+from .maze_file import unpack_cells, row_bytes
+from .assets import load_image, preload
+from .protocol import СlientToServer, send_message, recv_message, \
+                      encode_setup, decode_setup, encode_client, \
+                      decode_client, encode_server, decode_server, \
+                      SETUP_OK, SETUP_RESEND
+from .session import ServerSession, TICK_RATE, prepare_server
+from .async_server import AsyncServer, SESSION_TIMEOUT, BACKLOG
+from .lobby import Lobby, MIN_PLAYERS, FILL_TIMEOUT
+from .maze_pool import POOL_SIZE
+from .maze_cache import MAZE_CACHE, CACHE_BYTES
+from threading import Thread, Lock, Condition
+from time import perf_counter, sleep
+
+
+# the remote player is drawn this many ticks behind the newest snapshot,
+# the drawn own player closes this part of its distance to the predicted
+# one every frame unless it is further than SNAP_DISTANCE, e.g. teleported
+INTERPOLATION_TICKS = 4
+CORRECTION_RATE = 0.3
+SNAP_DISTANCE = 2 * Globals.CELL_SIZE
+
+
+def setup_world(data, walls):
+    # the maze is generated again from its seed, unless walls has its
+    # packed cells. The solution and the bonuses are then the same as on
+    # the server since they only depend on the maze and the bonus seed
+    size = (data.width, data.height)
+    if walls:
+        my_maze = MazeWithGraphics(None, size, run_alg=False)
+        my_maze.maze = unpack_cells(
+            np.frombuffer(walls, dtype=np.uint8).reshape(
+                data.height, row_bytes(data.width)), data.width)
+        my_maze.visited.fill(1)
+    elif data.algorithm in GENERATORS:
+        my_maze = MAZE_CACHE.generate(MazeWithGraphics, 
+                                      GENERATORS[data.algorithm], size, 
+                                      data.seed)
+    else:
+        return None
+
+    my_maze.set_elems_to_draw(data.solution)
+    return Simulation(my_maze, data.players, data.speed, data.bonuses, 
+                      data.bonus_seed, realtime=True)
+
+
+def receive_world(sock, data):
+    # the packed cells are asked for once if the maze made here differs
+    # from the server maze
+    world = setup_world(data, data.walls)
+    if world is None or world.maze.checksum() != data.checksum:
+        send_message(sock, SETUP_RESEND)
+        world = setup_world(data, recv_message(sock))
+        if world.maze.checksum() != data.checksum:
+            raise Exception("The maze differs from the server maze")
+    else:
+        send_message(sock, SETUP_OK)
+    return world
+
+
+def send_setup(conns, settings, walls):
+    for conn in conns:
+        send_message(conn, encode_setup(settings))
+    for conn in conns:
+        if recv_message(conn) == SETUP_RESEND:
+            send_message(conn, walls)
+
+
+def interpolate(states, tick):
+    # states are (tick, x, y) in order, the ones before the two around
+    # tick are not needed any more
+    while len(states) > 2 and states[1][0] <= tick:
+        states.popleft()
+    (tick_0, x_0, y_0), (tick_1, x_1, y_1) = \
+        states[0], states[min(1, len(states) - 1)]
+    if tick_1 == tick_0 or abs(x_1 - x_0) + abs(y_1 - y_0) > SNAP_DISTANCE:
+        return x_1, y_1
+    part = min(max((tick - tick_0) / (tick_1 - tick_0), 0), 1)
+    return round(x_0 + (x_1 - x_0) * part), round(y_0 + (y_1 - y_0) * part)
+
+
+class Connection:
+    # the game loop never waits for the network: a thread sends the queued
+    # messages and another one reads snapshots and rebuilds full states
+    # from their deltas. Snapshots are deltas against a tick the client
+    # has acknowledged, the states of those ticks are kept until the
+    # server stops using them. Tick 0 is the start of the game
+    def __init__(self, sock, players):
+        self.sock = sock
+        self.ack = 0
+        self.alive = True
+        self.outgoing = Queue()
+        self.incoming = Queue()
+        self.history = {0: ([(player.rect.x, player.rect.y, player.speed)
+                             for player in players], [0.0] * len(players))}
+        self.sender = Thread(target=self.send_loop, daemon=True)
+        self.receiver = Thread(target=self.receive_loop, daemon=True)
+
+
+    def start(self):
+        self.sender.start()
+        self.receiver.start()
+
+
+    def send(self, message):
+        self.outgoing.put(message)
+
+
+    def received(self):
+        # every state that has arrived since the last call, in order
+        states = []
+        try:
+            while True:
+                states.append(self.incoming.get_nowait())
+        except Empty:
+            return states
 
 
+    def close(self):
+        # the last message tells the server the player has left
+        self.outgoing.put(None)
+        self.sender.join(timeout=1)
+        self.sock.close()
 
-@dataclass
-class СlientToServer:
-    x: int
-    y: int
-    destroyed_wall: list
-    running: int
-    end_time: float
 
+    def send_loop(self):
+        try:
+            while (message := self.outgoing.get()) is not None:
+                send_message(self.sock, message)
+        except OSError:
+            self.alive = False
 
 
-@dataclass
-class ServerToClient:
-    x0: int
-    y0: int
-    x1: int
-    y1: int
-    speed: int
-    bonuses: list
-    destroyed_wall: list
-    running: int
-    end_time: float
+    def receive_loop(self):
+        try:
+            while True:
+                data = decode_server(recv_message(self.sock))
+                players, end_times = self.history[data.baseline]
+                players, end_times = list(players), list(end_times)
+                for num, x, y, speed in data.players:
+                    players[num] = (x, y, speed)
+                for num, end_time in data.end_times:
+                    end_times[num] = end_time
+                self.history = {tick: state 
+                                for tick, state in self.history.items()
+                                    if tick == 0 or tick >= data.baseline}
+                self.history[data.tick] = (players, end_times)
+                self.ack = data.tick
+                self.incoming.put((data, players, end_times))
+        except (OSError, ValueError, KeyError, struct.error):
+            self.alive = False
 
 
 
 class Client:
     _id_counter = 0
-    def __init__(self, host="localhost"):
+    def __init__(self, host="localhost", predict=True):
         self.id = Client._id_counter
         Client._id_counter += 1
         self.client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # messages are small and sent every frame, do not batch them
+        self.client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         self.host = host
         self.port = 8080
+        self.predict = predict
 
     def connect(self):
         try:
@@ -64,124 +185,118 @@ class Client:
     def start_client_game(self):
         pygame.init()
         
-        data = SetUpGame(*json.loads(
-            self.client.recv(1024*10).decode('UTF-8')).values())
-        
-        bonuses = bool(data.bonuses)
-        my_maze = MazeWithGraphics(None, 
-                                   (data.width, data.height), 
-                                   run_alg=False)
-        
-        my_maze.set_zeros()
-        my_maze.set_elems(data.walls, 1)
-        my_maze.set_elems_to_draw(data.solution)
-        my_maze.set_elems(data.bonuses, -1)
+        data = decode_setup(recv_message(self.client))
 
-        screen = pygame.display.set_mode((size_convert(my_maze.width), 
-                                          size_convert(my_maze.height)))
+        screen = pygame.display.set_mode((size_convert(data.width), 
+                                          size_convert(data.height)))
 
         pygame.display.set_caption("Try to solve!")
-        path_icon = PurePath('images', "icon.png")
-        pygame_icon = pygame.image.load(path_icon)
-        pygame.display.set_icon(pygame_icon)
+        pygame.display.set_icon(load_image("icon.png"))
+        preload()
         clock = pygame.time.Clock() 
         
-        walls_sprites_list = my_maze.add_walls_to_group()
-        solution_sprites_list = my_maze.add_solution_to_group()
-        start_end_cells = my_maze.add_start_end_to_group()
-        bonuses_group = pygame.sprite.Group()
-        if bonuses:
-            counts_bounses = (my_maze.width + my_maze.height) // 2
-            bonuse_tp = []
-            bonuse_speed_up = []
-            bonuse_speed_down = []
-            for i, bonus in enumerate(data.bonuses):
-                if i < counts_bounses:
-                    bonuse_tp.append(MazeBonuses(
-                        bonus[0], bonus[1], "teleport"))
-                    
-                elif i <  counts_bounses + 4:
-                    bonuse_speed_up.append(MazeBonuses(
-                        bonus[0], bonus[1], "speed_up"))
-                else:
-                    bonuse_speed_down.append(MazeBonuses(
-                        bonus[0], bonus[1], "speed_down"))
-            
-            bonuses_group.add(*bonuse_tp, 
-                              *bonuse_speed_up, 
-                              *bonuse_speed_down)
-            
-        player_0 = Player(0, speed=data.speed)
-        group_players = pygame.sprite.Group()
-        group_players.add(player_0)
-
-        player_1 = Player(1, speed=data.speed)
-        group_players.add(player_1)
-        Globals.END_GAME_TIME[1] = False
-
-        start_time = time()
+        # the server moves everything, the client only predicts where it
+        # will move its own player
+        world = receive_world(self.client, data)
+
+        my_maze = world.maze
+        static_layer = my_maze.get_static_layer()
+        screen.blit(static_layer, (0, 0))
+        pygame.display.flip()
+
+        connection = Connection(self.client, world.players)
+        connection.start()
+        local, *remotes = world.players
+        # the own player is moved at once from the keys, the position the
+        # server has confirmed is replayed with the inputs it hasn't
+        # applied yet and the drawn position slides to the result
+        predicted = local.rect.topleft
+        pending = deque()
+        error = pygame.Vector2()
+        # the remote players are drawn between the two snapshots around
+        # the server time INTERPOLATION_TICKS ago
+        remote_states = [deque() for _ in remotes]
+        clock_offset = float("inf")
+        end_times = [0.0] * len(world.players)
+        sequence = 0
         running = True
-        while running:
+        while running and connection.alive:
 
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     running = False
-                print_winner(start_time, 2)
-
-            group_players.update(
-                walls_sprites_list, 
-                start_end_cells.sprites()[1],
-                size_convert(my_maze.width), 
-                size_convert(my_maze.height),
-                bonuses)
-            try:
-                self.client.sendall(bytes(json.dumps(asdict(СlientToServer(
-                    player_0.rect.x, player_0.rect.y,
-                    Globals.DESTROYED_WALLS,
-                    running,Globals.END_GAME_TIME[0]))), 'UTF-8'))
-            except:
-                break
-            
-            try:
-                data = ServerToClient(*json.loads(
-                    self.client.recv(1024*10).decode('UTF-8')).values())
-            except:
-                print_winner(start_time, 2)
+
+            command = keyboard_command(0)
+            sequence += 1
+            connection.send(encode_client(СlientToServer(
+                sequence, connection.ack, command, running)))
+            if not running:
                 break
-                
-            player_0.rect.x = data.x0
-            player_0.rect.y = data.y0
-            player_1.rect.x = data.x1
-            player_1.rect.y = data.y1
-            player_0.speed  = data.speed
-            bonuses_coords  = data.bonuses
-            Globals.DESTROYED_WALLS = data.destroyed_wall
-            running *= data.running
-
-            if data.end_time > 0:
-                Globals.END_GAME_TIME[1] = data.end_time
-                print_winner(start_time, 2)
-
-            for bonus in bonuses_group.sprites():
-                if not [bonus.rect.x, bonus.rect.y] in bonuses_coords:
-                    bonuses_group.remove(bonus)
-
-            for wall in walls_sprites_list.sprites():
-                if [wall.rect.x, wall.rect.y] == Globals.DESTROYED_WALLS:
-                    walls_sprites_list.remove(wall)
-            
-            screen.fill(Globals.SURFACE_COLOR)
-            walls_sprites_list.draw(screen)
-            solution_sprites_list.draw(screen)
-            start_end_cells.draw(screen)
-            group_players.draw(screen)
-            if bonuses:
-                bonuses_group.draw(screen)
+
+            confirmed = None
+            for data, players, end_times in connection.received():
+                for index in data.removed_bonuses:
+                    world.bonus_list[index].kill()
+                for wall in data.destroyed_walls:
+                    for elem in my_maze.get_walls_in(
+                            pygame.Rect(*wall, 1, 1)):
+                        my_maze.destroy_wall(elem)
+                clock_offset = min(clock_offset, 
+                                   perf_counter() - data.tick / TICK_RATE)
+                for states, player in zip(remote_states, players[1:]):
+                    states.append((data.tick, *player[:2]))
+                confirmed = data.sequence, players[0]
+
+            if not self.predict:
+                if confirmed:
+                    (local.rect.x, local.rect.y, local.speed) = confirmed[1]
+                for remote, states in zip(remotes, remote_states):
+                    if states:
+                        remote.rect.topleft = states.pop()[1:]
+                        states.clear()
+            else:
+                if confirmed:
+                    last_sequence, (x, y, local.speed) = confirmed
+                    while pending and pending[0][0] <= last_sequence:
+                        pending.popleft()
+                    local.rect.topleft = (x, y)
+                    for _, old_command in pending:
+                        local.update(old_command, world)
+                    error += pygame.Vector2(predicted) - local.rect.topleft
+                    predicted = local.rect.topleft
+
+                # walls are destroyed only by the server, the prediction
+                # meets them as walls until the snapshot arrives
+                command.destroy = False
+                local.rect.topleft = predicted
+                local.update(command, world)
+                predicted = local.rect.topleft
+                pending.append((sequence, command))
+
+                error *= 1 - CORRECTION_RATE
+                if error.length() > SNAP_DISTANCE:
+                    error.update(0, 0)
+                local.rect.topleft = pygame.Vector2(predicted) + error
+
+                tick = ((perf_counter() - clock_offset) * TICK_RATE - 
+                        INTERPOLATION_TICKS)
+                for remote, states in zip(remotes, remote_states):
+                    if states:
+                        remote.rect.topleft = interpolate(states, tick)
+
+            world.state.end_game_time = list(end_times)
+            print_winner(world.state, 0, len(world.players))
+
+            world.players_group.clear(screen, static_layer)
+            world.bonuses_group.clear(screen, static_layer)
+            dirty_rects = my_maze.draw_changes(screen)
+            dirty_rects += world.players_group.draw(screen)
+            dirty_rects += world.bonuses_group.draw(screen)
             
-            pygame.display.flip() 
+            pygame.display.update(dirty_rects) 
             clock.tick(60)
         
-        self.client.close()
+        connection.close()
         print("Connection to the server has been lost")
         pygame.quit()  
         quit()
@@ -197,132 +312,142 @@ class Server:
             self.s.bind((self.host, self.port))
         except socket.error as e:
             str(e)
-        self.s.listen()
+        self.s.listen(BACKLOG)
 
 
     def accept_clients(self, alg, width, height, filename,
-                solution, bonuses, speed):
+                solution, bonuses, speed, 
+                room_size=MIN_PLAYERS, fill_timeout=FILL_TIMEOUT,
+                pool_size=POOL_SIZE):
         
-        thread_number = 0
+        pool = prepare_server(alg, width, height, filename, solution, 
+                              pool_size)
+        # accepted clients go to the lobby at once, a separate thread
+        # puts them into rooms so a client that never plays can't hold
+        # up the ones after it
+        lobby = Lobby(room_size, fill_timeout)
+        joined = Condition()
+        Thread(target=self.match_clients, 
+               args=(lobby, joined, pool, alg, width, height, filename, 
+                     solution, bonuses, speed),
+               daemon=True).start()
         try:
             while True:
 
-                Client_0, address_0 = self.s.accept()
-                print(f"Connected to: {address_0[0]}:{address_0[1]}")
-                
-                Client_1, address_1 = self.s.accept()
-                print(f"Connected to: {address_1[0]}:{address_1[1]}")
-
-                t = Thread(target=self.start_server_game,
-                           args=(Client_0, Client_1, alg, width, height,
-                                 filename, solution, bonuses, speed),
-                           daemon=True)
-                
-                t.start()
-                thread_number += 1
-                print(f'{thread_number = }')
+                conn, address = self.s.accept()
+                print(f"Connected to: {address[0]}:{address[1]}")
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                with joined:
+                    lobby.join(conn)
+                    joined.notify()
 
         except Exception as e:
             print(e)
         finally:    
             self.s.close() 
+            if pool:
+                pool.close()
 
 
-    def start_server_game(self, conn_0, conn_1, 
-                          alg, width, height, filename,
-                          solution, bonuses, speed):
-
-        if filename:
-            my_maze = MazeWithGraphics.upload(filename, alg)
-        else:
-            my_maze = MazeWithGraphics(alg, (width, height))
-        
-        my_maze.set_elems_to_draw(solution)
-     
-        if bonuses:
-            count_bonuse_tp = (my_maze.width + my_maze.height) // 2
-            bonuse_tp = [MazeBonuses(*my_maze.get_random_cell(), "teleport")
-                            for _ in range(count_bonuse_tp)]
-            
-            bonuse_speed_up = [MazeBonuses(*my_maze.get_random_cell(), 
-                                           "speed_up") for _ in range(4)]
-            
-            bonuse_speed_down = [MazeBonuses(*my_maze.get_random_cell(),
-                                            "speed_down") for _ in range(4)]
-            
-            bonuses_group = pygame.sprite.Group(*bonuse_tp, 
-                                                *bonuse_speed_up, 
-                                                *bonuse_speed_down)
-        
-        settings = SetUpGame(width,
-                             height,
-                             speed,
-                             solution,
-                             my_maze.get_elems(1),
-                             my_maze.get_elems(-1))
-        
-        conn_0.sendall(bytes(json.dumps(asdict(settings)), 'UTF-8'))
-        conn_1.sendall(bytes(json.dumps(asdict(settings)), 'UTF-8'))
-        
-        player_0 = Player(0, speed=speed)
-        group_players = pygame.sprite.Group()
-        group_players.add(player_0)
-
-        player_1 = Player(1, speed=speed)
-        group_players.add(player_1)
-        Globals.END_GAME_TIME[1] = False
-
+    def match_clients(self, lobby, joined, pool, *settings):
+        thread_number = 0
         while True:
-            try:
-                data_0 = СlientToServer(*json.loads(
-                    conn_0.recv(2048).decode('UTF-8')).values())
-                data_1 = СlientToServer(*json.loads(
-                    conn_1.recv(2048).decode('UTF-8')).values())
-            except:
-                break
+            with joined:
+                joined.wait(lobby.wait_time())
+                evicted = lobby.evict()
+                rooms = lobby.rooms()
+
+            for conn in evicted:
+                conn.close()
+            for conns in rooms:
+                Thread(target=self.start_server_game,
+                       args=(conns, pool, *settings), daemon=True).start()
+                thread_number += 1
+                print(f'{thread_number = }')
 
-            player_0.rect.x = data_0.x
-            player_0.rect.y = data_0.y
-            player_1.rect.x = data_1.x
-            player_1.rect.y = data_1.y
 
+    def read_inputs(self, session, lock, num, conn):
+        try:
+            while session.running:
+                data = decode_client(recv_message(conn))
+                with lock:
+                    session.receive(num, data)
+        except:
+            pass
 
-            bonuses_coords = []
-            if bonuses:
-                bonuses_group.update(player_0, my_maze)
-                bonuses_group.update(player_1, my_maze)
 
-                for elem in bonuses_group.sprites():
-                    bonuses_coords.append((elem.rect.x, elem.rect.y))
+    def start_server_game(self, conns, pool,
+                          alg, width, height, filename,
+                          solution, bonuses, speed):
 
+        session = ServerSession(len(conns), alg, width, height, filename, 
+                                solution, bonuses, speed, pool=pool)
+        try:
+            send_setup(conns, session.settings, session.walls)
+        except OSError:
+            for conn in conns:
+                conn.close()
+            return
+
+        # inputs are read by a thread per client, the session ticks here
+        # at a fixed rate whether they have sent anything or not
+        lock = Lock()
+        readers = [Thread(target=self.read_inputs, 
+                          args=(session, lock, num, conn), daemon=True)
+                   for num, conn in enumerate(conns)]
+        for reader in readers:
+            reader.start()
+
+        next_tick = perf_counter()
+        while session.running and all(reader.is_alive() 
+                                      for reader in readers):
+            with lock:
+                session.tick()
+                messages = [encode_server(session.snapshot(num)) 
+                            for num in range(len(conns))]
             try:
-                conn_0.sendall(bytes(json.dumps(asdict(ServerToClient(
-                    player_0.rect.x, player_0.rect.y,
-                    player_1.rect.x, player_1.rect.y,
-                    player_0.speed, bonuses_coords,
-                    data_1.destroyed_wall, data_1.running,
-                    data_1.end_time))), 'UTF-8'))
-                conn_1.sendall(bytes(json.dumps(asdict(ServerToClient(
-                    player_1.rect.x, player_1.rect.y,
-                    player_0.rect.x, player_0.rect.y,
-                    player_1.speed, bonuses_coords,
-                    data_0.destroyed_wall, data_0.running,
-                    data_0.end_time))), 'UTF-8'))
+                for conn, message in zip(conns, messages):
+                    send_message(conn, message)
             except:
                 break
+
+            now = perf_counter()
+            next_tick = max(next_tick + 1 / TICK_RATE, now)
+            sleep(next_tick - now)
+
+        for conn in conns:
+            conn.close()
         
 
 
-def start_client(host):
-    c = Client(host)
+def start_client(host, predict=True):
+    c = Client(host, predict)
     c.connect()
     c.start_client_game()
     
 
 def start_server(alg, width, height, filename,
-                 solution, bonuses, speed):
+                 solution, bonuses, speed, 
+                 use_asyncio=False, timeout=SESSION_TIMEOUT,
+                 room_size=MIN_PLAYERS, fill_timeout=FILL_TIMEOUT,
+                 pool_size=POOL_SIZE, cache_size=CACHE_BYTES):
     host = socket.gethostbyname(socket.gethostname())
     print(f"Server IPv4: {host}")
-    s = Server(host)
-    s.accept_clients(alg, width, height, filename,
-                     solution, bonuses, speed)
\ No newline at end of file
+    MAZE_CACHE.resize(cache_size)
+    try:
+        if use_asyncio:
+            try:
+                asyncio.run(AsyncServer(host, timeout=timeout, 
+                                        room_size=room_size,
+                                        fill_timeout=fill_timeout,
+                                        pool_size=pool_size).serve(
+                    alg, width, height, filename, solution, bonuses, speed))
+            except KeyboardInterrupt:
+                print("Server stopped")
+            return
+        s = Server(host)
+        s.accept_clients(alg, width, height, filename,
+                         solution, bonuses, speed, room_size, fill_timeout,
+                         pool_size)
+    finally:
+        print(f"Maze cache: {MAZE_CACHE.stats()}")
\ No newline at end of file
@@ -1,22 +1,30 @@
 import argparse
 from .game import start_game
 from .network_utils import start_client, start_server 
-from .maze import start_generator, alg_DFS, alg_Prim
+from .async_server import SESSION_TIMEOUT
+from .lobby import MIN_PLAYERS, MAX_PLAYERS, FILL_TIMEOUT
+from .maze_pool import POOL_SIZE
+from .maze_cache import CACHE_BYTES
+from .maze import start_generator
+from .batch import start_batch_generator
+from .benchmark import start_benchmark
+from .generators import GENERATORS
 
 class RangeError(Exception):
     pass
 
-def check_range(int_value):
-    if 6 <= int_value <= 19:
+def check_range(int_value, max_value=19):
+    if 6 <= int_value and (max_value is None or int_value <= max_value):
         return True
-    raise RangeError(f"Side of the maze must be between 6 and 19\n"
+    bounds = f"between 6 and {max_value}" if max_value else "at least 6"
+    raise RangeError(f"Side of the maze must be {bounds}\n"
                      f"You entered: {int_value}")
 
 
-def check(value):
+def check(value, max_value=19):
     try:
         int_value = int(value)
-        check_range(int_value)
+        check_range(int_value, max_value)
     except ValueError:
         raise argparse.ArgumentTypeError(f"Enter an integer\n"
                                          f"You entered: {value}")
@@ -28,9 +36,7 @@ def check(value):
 
 def define_alg(func):
     def wrapper(*args, **kwargs):
-        algs = {"DFS": alg_DFS,
-                "Prim": alg_Prim}
-        args[0].algorithm = algs[args[0].algorithm]
+        args[0].algorithm = GENERATORS[args[0].algorithm]
         return func(*args, **kwargs)
     return wrapper
     
@@ -47,39 +53,52 @@ def start_game_on_server(args):
     print("Start server")
     start_server(args.algorithm, args.size[0], args.size[1],
                      args.filename, args.solution, 
-                     args.bonuses, args.velocity)
+                     args.bonuses, args.velocity,
+                     args.asyncio, args.timeout, 
+                     args.room_size, args.fill_timeout, args.pool_size,
+                     args.cache_size * 2 ** 20)
     
     
 def play_online_game(args):
     print("Start online game")
-    start_client(args.iphost)
+    start_client(args.iphost, not args.no_prediction)
     
 @define_alg
 def generator(args):
     print("Start generator")
+    if args.count:
+        start_batch_generator(args.algorithm, args.size[0], args.size[1],
+                              args.count, args.output, args.jobs,
+                              args.seed, args.format, args.solution)
+        return
     start_generator(args.algorithm, args.size[0], args.size[1], 
                     args.solution, args.filename, 
-                    args.save_maze)
+                    args.save_maze, args.save_binary, args.seed)
     
 
+def benchmark(args):
+    print("Start benchmark")
+    start_benchmark(args.sizes, args.repeat, args.output,
+                    args.baseline, args.threshold, args.only, args.solve_size)
 
-def parse_maze_settings(parser):
+
+def parse_maze_settings(parser, max_size=19):
     group = parser.add_mutually_exclusive_group()
     group.add_argument(
         "-s", "--size", 
         help="Enter the size of the maze width, height", 
-        nargs=2, type=check, 
+        nargs=2, type=lambda value: check(value, max_size), 
         default=[10, 10], metavar=('w', 'h'))
     
     group.add_argument(
         '-f', "--filename", 
-        help="Enter <filename.txt> to download the maze", 
+        help="Enter <filename.txt> or <filename.maze> to download the maze", 
         type=str)
     
     parser.add_argument(
         "-a", "--algorithm", 
         help="Select the generation algorithm", 
-        type=str, choices=['DFS', 'Prim'], default='DFS')
+        type=str, choices=list(GENERATORS), default='DFS')
     
     parser.add_argument(
         "-sol", "--solution", 
@@ -157,6 +176,38 @@ def parser_args():
     parse_maze_settings(parser_server)
 
     parse_game_settings(parser_server, is_online_game=True)
+
+    parser_server.add_argument(
+        "-as", "--asyncio",
+        help="Serve all sessions from one asyncio event loop",
+        action='store_true')
+
+    parser_server.add_argument(
+        "-to", "--timeout",
+        help="Seconds an asyncio session waits for its players",
+        type=float, default=SESSION_TIMEOUT)
+
+    parser_server.add_argument(
+        "-rs", "--room_size",
+        help="Number of players in a game",
+        type=int, choices=range(MIN_PLAYERS, MAX_PLAYERS + 1), 
+        default=MIN_PLAYERS)
+
+    parser_server.add_argument(
+        "-ft", "--fill_timeout",
+        help="Seconds a room waits to fill up before it starts\n"
+        "with the players it has",
+        type=float, default=FILL_TIMEOUT)
+
+    parser_server.add_argument(
+        "-ps", "--pool_size",
+        help="Most mazes generated ahead of the games, 0 turns it off",
+        type=int, default=POOL_SIZE)
+
+    parser_server.add_argument(
+        "-cs", "--cache_size",
+        help="MiB of loaded mazes kept in memory",
+        type=int, default=CACHE_BYTES // 2 ** 20)
     
     parser_server.set_defaults(func=start_game_on_server)
 
@@ -170,21 +221,101 @@ def parser_args():
         "-iph", "--iphost",
         help="Connects to server by this ip: <XXX.XXX.XXX.X>",
         type=str, required=True)
+
+    parser_player.add_argument(
+        "-np", "--no_prediction",
+        help="Draw both players only where the server has moved them",
+        action='store_true')
     parser_player.set_defaults(func=play_online_game)
 
 
     parser_generator = subparsers.add_parser(
         "generator", 
         help="Maze generation mode")
-    parse_maze_settings(parser_generator)
+    # the console generator has no window to fit, so only the game modes
+    # cap the side of the maze
+    parse_maze_settings(parser_generator, max_size=None)
 
     parser_generator.add_argument(
         "-sm", "--save_maze", 
         help="Save the maze in txt format", 
         action='store_true')
 
+    parser_generator.add_argument(
+        "-sb", "--save_binary", 
+        help="Save the maze in compact binary .maze format", 
+        action='store_true')
+
+    parser_generator.add_argument(
+        "-sd", "--seed", 
+        help="Seed of the generator, stored in .maze files", 
+        type=int)
+
+    parser_generator.add_argument(
+        "-n", "--count", 
+        help="Batch mode: generate N mazes with seeds derived from --seed", 
+        type=int)
+
+    parser_generator.add_argument(
+        "-o", "--output", 
+        help="Batch mode: output directory or <archive.zip>", 
+        type=str, default="mazes")
+
+    parser_generator.add_argument(
+        "-j", "--jobs", 
+        help="Batch mode: number of worker processes (all cores by default)", 
+        type=int)
+
+    parser_generator.add_argument(
+        "-fmt", "--format", 
+        help="Batch mode: file format of the mazes", 
+        type=str, choices=['maze', 'txt'], default='maze')
+
     parser_generator.set_defaults(func=generator)
 
 
+    parser_benchmark = subparsers.add_parser(
+        "benchmark", 
+        help="Time generation, solving, parsing and rendering")
+
+    parser_benchmark.add_argument(
+        "-s", "--sizes", 
+        help="Sides of the square mazes to benchmark", 
+        nargs='+', type=int, default=[10, 50, 200])
+
+    parser_benchmark.add_argument(
+        "-r", "--repeat", 
+        help="Runs per case, the fastest one is reported", 
+        type=int, default=3)
+
+    parser_benchmark.add_argument(
+        "-o", "--output", 
+        help="JSON file for the results", 
+        type=str, default="benchmark.json")
+
+    parser_benchmark.add_argument(
+        "-b", "--baseline", 
+        help="JSON results to compare with, exits with 1 on regressions", 
+        type=str)
+
+    parser_benchmark.add_argument(
+        "-t", "--threshold", 
+        help="Slowdown ratio reported as a regression", 
+        type=float, default=0.25)
+
+    parser_benchmark.add_argument(
+        "-k", "--only", 
+        help="Run only the cases whose name contains this string", 
+        type=str)
+
+    parser_benchmark.add_argument(
+        "-ss", "--solve_size", 
+        help="Also time astar on a Sidewinder maze of this side, without "
+             "memory tracing", 
+        type=int)
+
+    parser_benchmark.set_defaults(func=benchmark)
+
+
     args = parser.parse_args()
     args.func(args)
@@ -0,0 +1,169 @@
+import struct
+from dataclasses import dataclass, fields
+from .game import Command
+
+
+# every message is a 4 byte length followed by the payload. SetUpGame is
+# followed by the packed maze cells when the maze can't be generated again
+# from its seed, the client answers it with SETUP_OK or asks for the cells
+# with SETUP_RESEND. After that clients send their numbered input with the
+# last snapshot tick they got, and the server sends snapshots with the
+# last input it has applied and only what changed since the baseline tick:
+# a header with the number of entries of every kind followed by the entries
+LENGTH = struct.Struct("<I")
+SETUP = struct.Struct("<IIIB??16sQQI")
+SETUP_OK = b"\x00"
+SETUP_RESEND = b"\x01"
+CLIENT_TO_SERVER = struct.Struct("<IIBB")
+SNAPSHOT = struct.Struct("<IIIBBHH")
+PLAYER = struct.Struct("<Biid")
+END_TIME = struct.Struct("<d")
+BONUS = struct.Struct("<H")
+POINT = struct.Struct("<ii")
+MAX_MESSAGE_SIZE = 64 * 2 ** 20
+
+
+@dataclass
+class SetUpGame:
+    width:      int 
+    height:     int
+    speed:      int
+    players:    int
+    solution:   bool
+    bonuses:    bool
+    algorithm:  str
+    seed:       int
+    bonus_seed: int
+    checksum:   int
+    walls:      bytes
+
+
+
+@dataclass
+class СlientToServer:
+    sequence: int
+    ack:      int
+    command:  Command
+    running:  int
+
+
+
+@dataclass
+class ServerToClient:
+    tick:            int
+    baseline:        int
+    sequence:        int
+    players:         list
+    end_times:       list
+    removed_bonuses: list
+    destroyed_walls: list
+
+
+
+def recv_exactly(sock, size):
+    # recv may return any part of the stream, so read until size bytes
+    # have arrived or the peer has closed the connection
+    data = bytearray(size)
+    view = memoryview(data)
+    while view:
+        received = sock.recv_into(view)
+        if not received:
+            raise ConnectionError("Connection closed by the peer")
+        view = view[received:]
+    return data
+
+
+def send_message(sock, payload):
+    sock.sendall(LENGTH.pack(len(payload)) + payload)
+
+
+def recv_message(sock):
+    size, = LENGTH.unpack(recv_exactly(sock, LENGTH.size))
+    if size > MAX_MESSAGE_SIZE:
+        raise ValueError(f"Message of {size} bytes is too large")
+    return recv_exactly(sock, size)
+
+
+async def read_message(reader):
+    # the same framing over asyncio streams
+    size, = LENGTH.unpack(await reader.readexactly(LENGTH.size))
+    if size > MAX_MESSAGE_SIZE:
+        raise ValueError(f"Message of {size} bytes is too large")
+    return await reader.readexactly(size)
+
+
+def write_message(writer, payload):
+    writer.write(LENGTH.pack(len(payload)) + payload)
+
+
+def encode_setup(message):
+    return SETUP.pack(message.width, message.height, message.speed,
+                      message.players, message.solution, message.bonuses,
+                      message.algorithm.encode('ascii'), message.seed,
+                      message.bonus_seed, message.checksum) + message.walls
+
+
+def decode_setup(data):
+    *fields, algorithm, seed, bonus_seed, checksum = \
+        SETUP.unpack_from(data)
+    return SetUpGame(*fields, algorithm.rstrip(b"\0").decode('ascii'),
+                     seed, bonus_seed, checksum, bytes(data[SETUP.size:]))
+
+
+def command_bits(command):
+    return sum(1 << bit for bit, field in enumerate(fields(Command))
+               if getattr(command, field.name))
+
+
+def bits_command(bits):
+    return Command(*(bool(bits >> bit & 1) 
+                     for bit in range(len(fields(Command)))))
+
+
+def encode_client(message):
+    return CLIENT_TO_SERVER.pack(message.sequence, message.ack,
+                                 command_bits(message.command), 
+                                 message.running)
+
+
+def decode_client(data):
+    sequence, ack, bits, running = CLIENT_TO_SERVER.unpack(data)
+    return СlientToServer(sequence, ack, bits_command(bits), running)
+
+
+def encode_server(message):
+    # end times are sent for the players set in a bit mask
+    mask = sum(1 << num for num, _ in message.end_times)
+    return SNAPSHOT.pack(message.tick, message.baseline, message.sequence,
+                         len(message.players), mask,
+                         len(message.removed_bonuses), 
+                         len(message.destroyed_walls)) + \
+        b"".join(PLAYER.pack(*player) for player in message.players) + \
+        b"".join(END_TIME.pack(end_time) 
+                 for _, end_time in sorted(message.end_times)) + \
+        b"".join(BONUS.pack(bonus) for bonus in message.removed_bonuses) + \
+        b"".join(POINT.pack(*wall) for wall in message.destroyed_walls)
+
+
+def decode_server(data):
+    tick, baseline, sequence, players, mask, bonuses, walls = \
+        SNAPSHOT.unpack_from(data)
+    finished = [num for num in range(8) if mask >> num & 1]
+    layouts = ((PLAYER, players), (END_TIME, len(finished)),
+               (BONUS, bonuses), (POINT, walls))
+    if SNAPSHOT.size + sum(layout.size * count 
+                           for layout, count in layouts) != len(data):
+        raise ValueError("Snapshot size does not match its header")
+
+    sections = []
+    offset = SNAPSHOT.size
+    for layout, count in layouts:
+        size = layout.size * count
+        sections.append(list(layout.iter_unpack(data[offset:offset + size])))
+        offset += size
+
+    players, end_times, bonuses, walls = sections
+    return ServerToClient(tick, baseline, sequence, players,
+                          [(num, end_time) for num, (end_time,) 
+                           in zip(finished, end_times)],
+                          [bonus for bonus, in bonuses], walls)
@@ -0,0 +1,63 @@
+import sys
+import numpy as np
+
+
+# a grid position on an even column is printed as one character and on an
+# odd column as three, so every row of a (2h+1)x(2w+1) grid is exactly
+# 4w+1 characters long and the glyphs of a row can be written with slices
+RENDER_CHUNK_ROWS = 1024
+
+
+def glyph_table(wall, path, free):
+    table = np.frombuffer(free * 256, dtype=np.uint8)\
+        .reshape(256, len(free)).copy()
+    table[1] = np.frombuffer(wall, dtype=np.uint8)
+    table[2] = np.frombuffer(path, dtype=np.uint8)
+    return table
+
+
+# glyph tables indexed by the grid value, walls on even columns are wall
+# posts on even rows and vertical walls on odd rows
+EVEN_COLUMN_GLYPHS = (glyph_table(b"+", b"@", b" ")[:, 0],
+                      glyph_table(b"|", b"@", b" ")[:, 0])
+ODD_COLUMN_GLYPHS = glyph_table(b"---", b"@@@", b"   ")
+
+
+def render_rows(grid, first_row=0):
+    # grid rows -> text of those rows, first_row is the index of the first
+    # one in the whole maze and decides which rows are wall post rows
+    rows, cols = grid.shape
+    line_size = (cols + 1) // 2 + 3 * (cols // 2)
+    out = np.empty((rows, line_size + 1), dtype=np.uint8)
+    out[:, -1] = ord("\n")
+
+    for parity in (0, 1):
+        band = slice((parity - first_row) % 2, None, 2)
+        out[band, 0:line_size:4] = \
+            EVEN_COLUMN_GLYPHS[parity][grid[band, 0::2]]
+
+    glyphs = ODD_COLUMN_GLYPHS[grid[:, 1::2]]
+    for offset in range(3):
+        out[:, 1 + offset:line_size:4] = glyphs[..., offset]
+    return out.tobytes()
+
+
+def render_chunks(grid, first_row=0):
+    for start in range(0, len(grid), RENDER_CHUNK_ROWS):
+        yield render_rows(grid[start:start + RENDER_CHUNK_ROWS],
+                          first_row + start)
+
+
+def write_chunks(chunks, stream=None):
+    # rendered text goes to the binary buffer of a text stream in large
+    # writes, streams without one get decoded text
+    stream = stream or sys.stdout
+    stream.flush()
+    buffer = getattr(stream, "buffer", None)
+    for chunk in chunks:
+        if buffer:
+            buffer.write(chunk)
+        else:
+            stream.write(chunk.decode())
+    if buffer:
+        buffer.flush()
@@ -0,0 +1,148 @@
+import random
+from collections import deque
+from .maze import Maze
+from .game import MazeWithGraphics, Simulation, Command
+from .maze_file import pack_cells, unpack_cells
+from .maze_cache import MAZE_CACHE, file_key
+from .maze_pool import MazePool
+from .assets import preload, set_headless
+from .protocol import SetUpGame, ServerToClient
+
+
+TICK_RATE = 60
+HISTORY_TICKS = 256
+MAX_QUEUED_INPUTS = 8
+
+
+def prepare_server(alg, width, height, filename, solution, pool_size):
+    # the server never draws, sessions share the images loaded once here.
+    # Mazes of the served configuration are made ahead of the sessions
+    # by worker processes, an uploaded maze is the same every time
+    set_headless()
+    preload()
+    if not pool_size or filename:
+        return None
+    pool = MazePool(pool_size)
+    pool.reserve(alg, width, height, solution)
+    return pool
+
+
+def uploaded_maze(filename, alg):
+    # clients get the uploaded maze as packed cells, it is rebuilt from
+    # them here too so both sides have the same grid
+    my_maze = Maze.upload(filename, alg)
+    my_maze.maze = unpack_cells(
+        pack_cells(my_maze.maze[1::2], my_maze.maze[2::2]), my_maze.width)
+    my_maze.solve()
+    return my_maze
+
+
+def create_session(alg, width, height, filename, solution, bonuses, speed,
+                   players=2, pool=None):
+    my_maze = None
+    if pool and not filename:
+        my_maze = pool.take(alg, width, height, solution)
+    if my_maze is None:
+        if filename:
+            my_maze = MAZE_CACHE.maze(MazeWithGraphics, file_key(filename),
+                                      lambda: uploaded_maze(filename, alg))
+        else:
+            my_maze = MazeWithGraphics(alg, (width, height))
+        my_maze.set_elems_to_draw(solution)
+
+    bonus_seed = random.randrange(2 ** 32)
+    world = Simulation(my_maze, players, speed, bonuses, bonus_seed)
+
+    # clients generate the maze from its seed and check it against the
+    # checksum, an uploaded maze may not come from a seed so its packed
+    # cells are sent along
+    walls = pack_cells(my_maze.maze[1::2], my_maze.maze[2::2]).tobytes()
+    settings = SetUpGame(my_maze.width,
+                         my_maze.height,
+                         speed,
+                         players,
+                         solution,
+                         bonuses,
+                         my_maze.algorithm_name,
+                         my_maze.seed,
+                         bonus_seed,
+                         my_maze.checksum(),
+                         walls if filename else b"")
+    return world, settings, walls
+
+
+class ServerSession:
+    # the server owns the game, it steps the world TICK_RATE times per
+    # second and applies one queued input of every client per tick, the
+    # last command is repeated while a client has sent nothing new. Every
+    # snapshot has what changed since the last tick its client has
+    # acknowledged, the states of the last HISTORY_TICKS ticks and of
+    # tick 0 are kept as baselines
+    def __init__(self, players, *settings, pool=None):
+        self.world, self.settings, self.walls = create_session(*settings,
+                                                               players, pool)
+        self.commands = [Command() for _ in self.world.players]
+        # clients predict their own player from the inputs the server
+        # hasn't applied yet, so inputs are applied in order one per tick
+        self.inputs = [deque() for _ in self.world.players]
+        self.sequences = [0 for _ in self.world.players]
+        self.acks = [0 for _ in self.world.players]
+        self.running = True
+        self.history = {0: self.baseline()}
+        self.oldest = 1
+
+
+    def baseline(self):
+        state = self.world.state
+        return ([(player.rect.x, player.rect.y, player.speed) 
+                 for player in self.world.players],
+                tuple(state.end_game_time),
+                len(self.world.removed_bonuses),
+                len(state.destroyed_walls))
+
+
+    def receive(self, num, message):
+        self.inputs[num].append((message.sequence, message.command))
+        # a client that sends faster than the tick rate loses its oldest
+        # inputs instead of falling further and further behind
+        if len(self.inputs[num]) > MAX_QUEUED_INPUTS:
+            self.inputs[num].popleft()
+        if message.ack in self.history:
+            self.acks[num] = max(self.acks[num], message.ack)
+        if not message.running:
+            self.running = False
+
+
+    def tick(self):
+        for num, inputs in enumerate(self.inputs):
+            if inputs:
+                self.sequences[num], self.commands[num] = inputs.popleft()
+        self.world.step(self.commands)
+        self.history[self.world.tick] = self.baseline()
+        limit = max(min(self.acks), self.world.tick - HISTORY_TICKS)
+        while self.oldest < limit:
+            self.history.pop(self.oldest, None)
+            self.oldest += 1
+
+
+    def snapshot(self, num):
+        # players are renumbered so the receiving client is always 0
+        baseline = self.acks[num] if self.acks[num] in self.history else 0
+        players, end_times, bonuses, walls = self.history[baseline]
+        world = self.world
+        state = world.state
+        count = len(world.players)
+
+        return ServerToClient(
+            world.tick, baseline, self.sequences[num],
+            [((player.num - num) % count, player.rect.x, player.rect.y,
+              player.speed) 
+             for player, old in zip(world.players, players)
+                if (player.rect.x, player.rect.y, player.speed) != old],
+            [((player.num - num) % count, 
+              state.end_game_time[player.num] / TICK_RATE)
+             for player in world.players
+                if state.end_game_time[player.num] and 
+                    not end_times[player.num]],
+            world.removed_bonuses[bonuses:],
+            state.destroyed_walls[walls:])
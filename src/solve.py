@@ -1,98 +1,81 @@
 import heapq
+import numpy as np
+from array import array
 
 
-class Node:
-    def __init__(self, x, y):
-        self.x = x  # x coordinate of the node on the map
-        self.y = y  # y coordinate of the node on the map
-        self.g = 0  # distance from start node to current node
-        self.h = 0  # distance from current node to target node
-        self.f = 0  # sum of g and h
-        self.parent = None  # parent node, used for path recovery
+def lattice_step(grid, start, end):
+    # in a maze grid every (even, even) position is a wall post, so a path
+    # between two cells always alternates cell/passage and A* can jump two
+    # positions at a time over the cells only
+    if all(value % 2 for value in (*start, *end)) and \
+            grid[::2, ::2].all():
+        return 2
+    return 1
 
-    # redefine the comparison operator to compare nodes
-    def __lt__(self, other):
-        return self.f < other.f
-
-    # redefine the equality operator to compare nodes
-    def __eq__(self, other):
-        return self.x == other.x and self.y == other.y
-    
-    # redefine the hash operator
-    def __hash__(self):
-        return hash((self.x, self.y))
 
 # function to find the path using algorithm A*
 def astar(start, end, maze):
+    grid = np.asarray(maze)
+    step = lattice_step(grid, start, end)
 
-    start_node = Node(start[0], start[1])
-    end_node = Node(end[0], end[1])
+    # nodes are flat indices of the grid padded with one ring of obstacles,
+    # so neighbours never leave the array; obstacles are non-zero cells
+    free = np.pad(grid == 0, 1)
+    rows, cols = free.shape
+    free = bytearray(free.ravel())
+    start_node = (start[0] + 1) * cols + start[1] + 1
+    end_node = (end[0] + 1) * cols + end[1] + 1
+    end_row, end_col = end[0] + 1, end[1] + 1
 
-    # initialise the priority queue
-    open_list = []
-    heapq.heappush(open_list, start_node)
+    # flat int32 arrays instead of node objects: g-score + 1 (0 means the
+    # node has not been reached yet), parent of the node and the closed flag
+    g_score = array('i', [0]) * (rows * cols)
+    parent = array('i', [-1]) * (rows * cols)
+    closed = bytearray(rows * cols)
 
-    # initialise the set of visited nodes
-    closed_set = set()
+    # the open set is a heap of (f, h, node); a node is pushed again every
+    # time its g-score improves and stale entries are skipped on pop
+    g_score[start_node] = 1
+    open_list = [(0, 0, start_node)]
+    offsets = (-cols, cols, -1, 1)
 
     while open_list:
         # retrieve the node with the lowest score f
-        current_node = heapq.heappop(open_list)
-   
-        if current_node == end_node:
+        _, _, current = heapq.heappop(open_list)
+        if closed[current]:
+            continue
+
+        if current == end_node:
             # reconstruct the path from the end node to the start node
             path = []
-            while current_node is not None:
-                path.append((current_node.x, current_node.y))
-                current_node = current_node.parent
-            return path[::-1]
+            while current != -1:
+                if path and step == 2:
+                    path.append(divmod((current + path_node) // 2, cols))
+                path.append(divmod(current, cols))
+                path_node = current
+                current = parent[current]
+            return [(row - 1, col - 1) for row, col in reversed(path)]
 
-        # add the current node to the set of visited nodes
-        closed_set.add(current_node)
+        closed[current] = 1
+        new_g = g_score[current] + step
 
-        # Get the neighbouring nodes
-        d_x_y = [(-1, 0), (1, 0), (0, -1), (0, 1)]
-        neighbors = []
-        for dx, dy in d_x_y:
-            x = current_node.x + dx
-            y = current_node.y + dy
-            # ignore nodes outside the map
-            if x < 0 or x >= len(maze) or y < 0 or y >= len(maze[0]):
+        for offset in offsets:
+            # ignore the obstacles and visited nodes
+            if not free[current + offset]:
                 continue
-            # ignore the obstacles
-            if maze[x][y]:
+            neighbor = current + offset * step
+            if not free[neighbor] or closed[neighbor]:
                 continue
-            # create a new node and add it to the list of neighbours
-            neighbor = Node(x, y)
-            neighbors.append(neighbor)
 
-        for neighbor in neighbors:
-            # visited neighbouring nodes skipped
-            if neighbor in closed_set:
+            if g_score[neighbor] and g_score[neighbor] <= new_g:
                 continue
 
-            new_g = current_node.g + 1
-
-            # if the neighbouring node is already in the priority queue
-            if nfo := next((n for n in open_list if n == neighbor), None):
-                if new_g < nfo.g:
-                    # update the values of g, h and f
-                    nfo.g = new_g
-                    nfo.h = (end_node.x - nfo.x) ** 2 + \
-                        (end_node.y - nfo.y) ** 2
-                    nfo.f = nfo.g + nfo.h
-                    nfo.parent = current_node
-                    # update the priority of the neighbouring node
-                    heapq.heapify(open_list)
-            else:
-                # add a neighbouring node to the priority queue
-                # calculate the values of g, h and f
-                neighbor.g = new_g
-                neighbor.h = (end_node.x - neighbor.x) ** 2 + \
-                    (end_node.y - neighbor.y) ** 2
-                neighbor.f = neighbor.g + neighbor.h
-                neighbor.parent = current_node
-                heapq.heappush(open_list, neighbor)
+            g_score[neighbor] = new_g
+            parent[neighbor] = current
+            # Manhattan distance is admissible on a 4-connected grid
+            row, col = divmod(neighbor, cols)
+            h = abs(end_row - row) + abs(end_col - col)
+            heapq.heappush(open_list, (new_g - 1 + h, h, neighbor))
 
     # if the destination node is unreachable, return None
-    return None
\ No newline at end of file
+    return None
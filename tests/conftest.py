@@ -0,0 +1,28 @@
+import os
+import pytest
+from pathlib import Path
+from src.maze import Maze
+from src.generators import GENERATORS
+from src.maze_file import EXTENSION
+
+
+# the tests never open a window
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+ROOT = Path(__file__).resolve().parent.parent
+SIZES = [(1, 1), (1, 6), (6, 1), (3, 5), (8, 3), (13, 13)]
+
+
+def saved_maze(path, name="DFS", size=(9, 5), seed=7):
+    # the file format is picked by the suffix, as upload does
+    my_maze = Maze(GENERATORS[name], size, seed=seed)
+    if path.suffix == EXTENSION:
+        my_maze.save_binary(path)
+    else:
+        my_maze.save(path)
+    return my_maze
+
+
+@pytest.fixture(autouse=True)
+def repo_dir(monkeypatch):
+    # images are loaded relative to the working directory
+    monkeypatch.chdir(ROOT)
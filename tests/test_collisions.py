@@ -0,0 +1,40 @@
+import random
+import pytest
+import numpy as np
+from src.game import MazeWithGraphics, Simulation, Command
+from src.generators import GENERATORS
+
+
+def world(seed, sprite_walls):
+    my_maze = MazeWithGraphics(GENERATORS["DFS"], (8, 6), seed=seed)
+    my_maze.set_elems_to_draw(True)
+    if sprite_walls:
+        # every wall sprite is checked in the order of the walls group,
+        # as players did before collisions were read from the grid
+        walls = my_maze.add_walls_to_group()
+        my_maze.get_walls_in = lambda rect: walls.sprites()
+    return Simulation(my_maze, players_count=2, speed=3, bonuses=True,
+                      bonus_seed=seed)
+
+
+def replay(world, seed, ticks):
+    rng = random.Random(seed)
+    frames = []
+    for _ in range(ticks):
+        world.step([Command(*(rng.random() < 0.4 for _ in range(5)))
+                    for _ in world.players])
+        frames.append([(player.rect.topleft, player.speed)
+                       for player in world.players])
+    return frames
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_grid_collisions_match_sprite_collisions(seed):
+    grid_world = world(seed, sprite_walls=False)
+    sprite_world = world(seed, sprite_walls=True)
+    assert replay(grid_world, seed, 3000) == replay(sprite_world, seed, 3000)
+    assert grid_world.state.destroyed_walls == \
+        sprite_world.state.destroyed_walls
+    assert grid_world.state.count_destroyed_walls == \
+        sprite_world.state.count_destroyed_walls
+    assert np.array_equal(grid_world.maze.maze, sprite_world.maze.maze)
@@ -0,0 +1,45 @@
+import pytest
+import numpy as np
+from src.maze import Maze
+from src.generators import GENERATORS
+from src.maze_file import MazeFile, HEADER
+from .conftest import SIZES, saved_maze
+
+
+def saved_binary(tmp_path, name="DFS", size=(9, 5)):
+    path = tmp_path / "saved.maze"
+    return saved_maze(path, name, size), path
+
+
+@pytest.mark.parametrize("size", SIZES)
+@pytest.mark.parametrize("name", sorted(GENERATORS))
+def test_upload_gives_saved_grid(tmp_path, name, size):
+    my_maze, path = saved_binary(tmp_path, name, size)
+    uploaded = Maze.upload(path, None)
+    assert (uploaded.width, uploaded.height) == size
+    assert (uploaded.algorithm_name, uploaded.seed) == (name, 7)
+    assert np.array_equal(uploaded.maze, my_maze.maze)
+
+
+def test_region_matches_grid(tmp_path):
+    my_maze, path = saved_binary(tmp_path, size=(7, 9))
+    maze_file = MazeFile(path)
+    for first_row in range(9):
+        for last_row in range(first_row + 1, 10):
+            assert np.array_equal(maze_file.region(first_row, last_row),
+                                  my_maze.maze[2 * first_row:
+                                               2 * last_row + 1])
+
+
+@pytest.mark.parametrize("cut", [
+    lambda data: data[:len(b"MAZE") + 2],
+    lambda data: data[:HEADER.size - 1],
+    lambda data: data[:HEADER.size],
+    lambda data: data[:-1],
+    lambda data: data + b"\0",
+    lambda data: data[:4] + b"\2" + data[5:]])
+def test_broken_file_is_rejected(tmp_path, cut):
+    _, path = saved_binary(tmp_path)
+    path.write_bytes(cut(path.read_bytes()))
+    with pytest.raises(ValueError):
+        Maze.upload(path, None)
@@ -0,0 +1,136 @@
+import socket
+import asyncio
+import pytest
+from threading import Thread
+from dataclasses import fields
+from itertools import product
+from src.game import Command
+from src.protocol import SetUpGame, СlientToServer, ServerToClient, \
+                         LENGTH, MAX_MESSAGE_SIZE, send_message, \
+                         recv_message, read_message, write_message, \
+                         encode_setup, decode_setup, encode_client, \
+                         decode_client, encode_server, decode_server
+
+
+SETUPS = [
+    SetUpGame(10, 8, 3, 2, True, False, "Prim", 2 ** 64 - 1, 5, 123, b""),
+    SetUpGame(1, 1, 1, 8, False, True, "Sidewinder", 0, 0, 2 ** 32 - 1,
+              bytes(range(256)))]
+
+SNAPSHOTS = [
+    ServerToClient(0, 0, 0, [], [], [], []),
+    ServerToClient(7, 3, 9, [(0, 21, 40, 3.0), (1, -5, 2 ** 31 - 1, 0.7)],
+                   [(1, 12.5)], [0, 65535], [(20, 40), (-1, 0)]),
+    ServerToClient(2 ** 32 - 1, 5, 1, [(num, num, num, 2.0)
+                                        for num in range(8)],
+                   [(num, num / 3) for num in (0, 3, 7)], [4], [])]
+
+
+class Chunked:
+    # a socket that hands the stream out a few bytes at a time
+    def __init__(self, data, chunk):
+        self.data = data
+        self.chunk = chunk
+
+    def recv_into(self, view):
+        size = min(self.chunk, len(view), len(self.data))
+        view[:size] = self.data[:size]
+        self.data = self.data[size:]
+        return size
+
+    def sendall(self, data):
+        self.data += data
+
+
+@pytest.mark.parametrize("message", SETUPS)
+def test_setup_round_trip(message):
+    assert decode_setup(encode_setup(message)) == message
+
+
+@pytest.mark.parametrize("bits", list(product([False, True],
+                                              repeat=len(fields(Command)))))
+def test_client_round_trip(bits):
+    message = СlientToServer(2 ** 32 - 1, 17, Command(*bits), 1)
+    assert decode_client(encode_client(message)) == message
+
+
+@pytest.mark.parametrize("message", SNAPSHOTS)
+def test_snapshot_round_trip(message):
+    assert decode_server(encode_server(message)) == message
+
+
+@pytest.mark.parametrize("cut", [-1, 1])
+def test_snapshot_size_must_match_header(cut):
+    data = encode_server(SNAPSHOTS[1])
+    with pytest.raises(ValueError):
+        decode_server(data[:cut] if cut < 0 else data + b"\0" * cut)
+
+
+@pytest.mark.parametrize("chunk", [1, 3, 1000])
+def test_messages_are_reassembled(chunk):
+    payloads = [encode_setup(SETUPS[1]), b"", encode_server(SNAPSHOTS[1]),
+                encode_client(СlientToServer(1, 2, Command(left=True), 1))]
+    sock = Chunked(b"", chunk)
+    for payload in payloads:
+        send_message(sock, payload)
+    assert [recv_message(sock) for _ in payloads] == payloads
+    assert sock.data == b""
+
+
+def test_socket_round_trip():
+    left, right = socket.socketpair()
+    with left, right:
+        payload = bytes(range(256)) * 1024
+        sender = Thread(target=send_message, args=(left, payload))
+        sender.start()
+        assert recv_message(right) == payload
+        sender.join()
+
+
+def test_too_large_length_is_rejected():
+    sock = Chunked(LENGTH.pack(MAX_MESSAGE_SIZE + 1) + b"\0" * 16, 1000)
+    with pytest.raises(ValueError):
+        recv_message(sock)
+
+
+@pytest.mark.parametrize("data", [b"", b"\1\0", LENGTH.pack(5) + b"abc"])
+def test_closed_stream_is_an_error(data):
+    with pytest.raises(ConnectionError):
+        recv_message(Chunked(data, 1000))
+
+
+class Writer:
+    def __init__(self):
+        self.data = b""
+
+    def write(self, data):
+        self.data += data
+
+
+def stream_messages(data, count, chunk):
+    async def read():
+        reader = asyncio.StreamReader()
+        for start in range(0, len(data), chunk):
+            reader.feed_data(data[start:start + chunk])
+        reader.feed_eof()
+        return [await read_message(reader) for _ in range(count)]
+    return asyncio.run(read())
+
+
+@pytest.mark.parametrize("chunk", [1, 7, 1000])
+def test_stream_messages_are_reassembled(chunk):
+    payloads = [encode_server(message) for message in SNAPSHOTS]
+    writer = Writer()
+    for payload in payloads:
+        write_message(writer, payload)
+    assert stream_messages(writer.data, len(payloads), chunk) == payloads
+
+
+def test_stream_too_large_length_is_rejected():
+    with pytest.raises(ValueError):
+        stream_messages(LENGTH.pack(MAX_MESSAGE_SIZE + 1), 1, 1000)
+
+
+def test_stream_cut_message_is_an_error():
+    with pytest.raises(asyncio.IncompleteReadError):
+        stream_messages(LENGTH.pack(5) + b"abc", 1, 1000)
@@ -0,0 +1,100 @@
+import socket
+import pytest
+import numpy as np
+from dataclasses import replace
+from threading import Thread
+from src.maze import Maze
+from src.generators import GENERATORS
+from src.session import create_session
+from src.protocol import LENGTH, SETUP_OK, SETUP_RESEND, recv_message, \
+                         decode_setup
+from src.network_utils import setup_world, receive_world, send_setup
+
+
+def bonus_cells(world):
+    return [bonus.rect.topleft for bonus in world.bonus_list]
+
+
+def assert_same_world(client, server):
+    assert np.array_equal(client.maze.maze, server.maze.maze)
+    assert bonus_cells(client) == bonus_cells(server)
+
+
+@pytest.mark.parametrize("name", sorted(GENERATORS))
+def test_maze_is_made_again_from_its_seed(name):
+    world, settings, _ = create_session(GENERATORS[name], 9, 7, None, 
+                                        True, True, 3)
+    assert settings.walls == b""
+    client = setup_world(settings, settings.walls)
+    assert client.maze.checksum() == settings.checksum
+    assert_same_world(client, world)
+
+
+@pytest.mark.parametrize("extension", [".txt", ".maze"])
+def test_uploaded_maze_is_sent_as_cells(tmp_path, extension):
+    path = tmp_path / f"uploaded{extension}"
+    my_maze = Maze(GENERATORS["Prim"], (6, 5))
+    if extension == ".maze":
+        my_maze.save_binary(path)
+    else:
+        my_maze.save(path)
+    world, settings, walls = create_session(None, 0, 0, path, 
+                                            True, True, 3)
+    assert settings.walls == walls
+    client = setup_world(settings, settings.walls)
+    assert client.maze.checksum() == settings.checksum
+    assert_same_world(client, world)
+
+
+class Recording:
+    # the client socket, keeping what the client sends
+    def __init__(self, sock):
+        self.sock = sock
+        self.sent = b""
+
+    def sendall(self, data):
+        self.sent += data
+        self.sock.sendall(data)
+
+    def recv_into(self, view):
+        return self.sock.recv_into(view)
+
+
+def handshake(settings, walls):
+    server, client = socket.socketpair()
+    with server, client:
+        sender = Thread(target=send_setup, args=([server], settings, walls))
+        sender.start()
+        recording = Recording(client)
+        data = decode_setup(recv_message(recording))
+        world = receive_world(recording, data)
+        sender.join()
+    return world, recording.sent
+
+
+def test_matching_maze_is_accepted():
+    world, settings, walls = create_session(GENERATORS["DFS"], 8, 8, None, 
+                                            True, True, 3)
+    client, sent = handshake(settings, walls)
+    assert sent == LENGTH.pack(1) + SETUP_OK
+    assert_same_world(client, world)
+
+
+@pytest.mark.parametrize("change", [
+    lambda settings: replace(settings, seed=settings.seed + 1),
+    lambda settings: replace(settings, algorithm="Unknown")])
+def test_different_maze_is_sent_again(change):
+    world, settings, walls = create_session(GENERATORS["DFS"], 8, 8, None, 
+                                            True, True, 3)
+    client, sent = handshake(change(settings), walls)
+    assert sent == LENGTH.pack(1) + SETUP_RESEND
+    assert client.maze.checksum() == settings.checksum
+    assert_same_world(client, world)
+
+
+def test_wrong_cells_are_an_error():
+    _, settings, walls = create_session(GENERATORS["DFS"], 8, 8, None, 
+                                        True, True, 3)
+    other = create_session(GENERATORS["DFS"], 8, 8, None, True, True, 3)[2]
+    with pytest.raises(Exception, match="differs"):
+        handshake(replace(settings, seed=settings.seed + 1), other)
@@ -0,0 +1,111 @@
+import random
+import pytest
+from src.game import Command
+from src.generators import GENERATORS
+from src.session import ServerSession, HISTORY_TICKS
+from src.protocol import СlientToServer, encode_server, decode_server
+
+
+def session():
+    return ServerSession(2, GENERATORS["Prim"], 15, 12, None, False, True, 2)
+
+
+def server_state(session, num):
+    # what client num must see, its own player first
+    world = session.world
+    players = world.players[num:] + world.players[:num]
+    return ([(player.rect.x, player.rect.y, player.speed) 
+             for player in players],
+            set(world.removed_bonuses), 
+            set(world.state.destroyed_walls))
+
+
+def history_state(session, num, tick):
+    players, _, bonuses, walls = session.history[tick]
+    world = session.world
+    return (players[num:] + players[:num],
+            set(world.removed_bonuses[:bonuses]),
+            set(world.state.destroyed_walls[:walls]))
+
+
+class Mirror:
+    # the state of every tick a client has got, made from the snapshot
+    # and the state of its baseline tick
+    def __init__(self, session, num):
+        self.states = {0: history_state(session, num, 0)}
+        self.ack = 0
+
+    def apply(self, snapshot):
+        players, bonuses, walls = self.states[snapshot.baseline]
+        players = list(players)
+        for num, x, y, speed in snapshot.players:
+            players[num] = (x, y, speed)
+        self.states[snapshot.tick] = (
+            players, bonuses | set(snapshot.removed_bonuses),
+            walls | set(map(tuple, snapshot.destroyed_walls)))
+        return self.states[snapshot.tick]
+
+
+def send(session, num, ack, rng, sequence=0):
+    command = Command(*(rng.random() < 0.4 for _ in range(5)))
+    session.receive(num, СlientToServer(sequence, ack, command, 1))
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_mirror_matches_server(seed):
+    rng = random.Random(seed)
+    server = session()
+    mirrors = [Mirror(server, num) for num in range(2)]
+    for tick in range(3000):
+        for num, mirror in enumerate(mirrors):
+            # a lost message leaves the server with the older ack
+            if rng.random() > 0.2:
+                send(server, num, mirror.ack, rng, tick)
+        server.tick()
+        for num, mirror in enumerate(mirrors):
+            snapshot = decode_server(encode_server(server.snapshot(num)))
+            assert snapshot.baseline <= mirror.ack
+            assert mirror.apply(snapshot) == server_state(server, num)
+            if rng.random() < 0.3:
+                mirror.ack = snapshot.tick
+    assert server.world.state.destroyed_walls
+    assert len(server.history) <= HISTORY_TICKS + 2
+
+
+def test_lost_ack_keeps_older_baseline():
+    rng = random.Random(1)
+    server = session()
+    for tick in range(10):
+        send(server, 0, 0, rng)
+        send(server, 1, 0, rng)
+        server.tick()
+    send(server, 0, 5, rng)
+    send(server, 1, 5, rng)
+    server.tick()
+    assert server.snapshot(0).baseline == 5
+
+    # the ack of tick 9 never arrives
+    for tick in range(5):
+        send(server, 1, 11, rng)
+        server.tick()
+    snapshot = server.snapshot(0)
+    assert snapshot.baseline == 5
+    mirror = Mirror(server, 0)
+    mirror.states[5] = history_state(server, 0, 5)
+    assert mirror.apply(snapshot) == server_state(server, 0)
+
+
+def test_pruned_ack_falls_back_to_tick_0():
+    rng = random.Random(2)
+    server = session()
+    send(server, 0, 0, rng)
+    send(server, 1, 0, rng)
+    server.tick()
+    send(server, 0, 1, rng)
+    for tick in range(HISTORY_TICKS + 10):
+        send(server, 1, server.world.tick, rng)
+        server.tick()
+    assert 1 not in server.history
+    snapshot = server.snapshot(0)
+    assert snapshot.baseline == 0
+    assert Mirror(server, 0).apply(snapshot) == server_state(server, 0)
@@ -0,0 +1,50 @@
+import pytest
+import numpy as np
+from src.maze import Maze, read_text_grid, write_text_grid
+from src.generators import GENERATORS
+from .conftest import SIZES, saved_maze
+
+
+def saved_text(tmp_path, name="DFS", size=(5, 4)):
+    path = tmp_path / "saved.txt"
+    return saved_maze(path, name, size), path
+
+
+@pytest.mark.parametrize("size", SIZES)
+@pytest.mark.parametrize("name", sorted(GENERATORS))
+def test_upload_gives_saved_grid(tmp_path, name, size):
+    my_maze, path = saved_text(tmp_path, name, size)
+    uploaded = Maze.upload(path, None)
+    assert (uploaded.width, uploaded.height) == size
+    assert np.array_equal(uploaded.maze, my_maze.maze)
+
+
+def test_solution_is_read_as_free_cells(tmp_path):
+    my_maze, path = saved_text(tmp_path)
+    my_maze.solve()
+    write_text_grid(path, my_maze.maze)
+    assert np.array_equal(read_text_grid(path), (my_maze.maze == 1) * 1)
+
+
+@pytest.mark.parametrize("change", [
+    lambda text: text.replace(b"\n", b"\r\n"),
+    lambda text: text.rstrip(b"\n")])
+def test_line_ends(tmp_path, change):
+    my_maze, path = saved_text(tmp_path)
+    path.write_bytes(change(path.read_bytes()))
+    assert np.array_equal(read_text_grid(path), my_maze.maze)
+
+
+@pytest.mark.parametrize("change", [
+    lambda text: b"",
+    lambda text: b"\n" + text,
+    lambda text: text[:-5],
+    lambda text: text[:text.index(b"\n") + 1] * 2,
+    lambda text: text.replace(b"\n", b" \n", 1),
+    lambda text: text + text[:text.index(b"\n") + 1],
+    lambda text: text.replace(b"+", b"x", 1)])
+def test_broken_file_is_rejected(tmp_path, change):
+    _, path = saved_text(tmp_path)
+    path.write_bytes(change(path.read_bytes()))
+    with pytest.raises(ValueError):
+        read_text_grid(path)